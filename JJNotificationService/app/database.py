@@ -1,8 +1,14 @@
 import os
+import logging
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker, scoped_session, declarative_base
+from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # ============================================================
 # Load environment variables
 # ============================================================
@@ -19,20 +25,65 @@ DB_NAME = os.getenv("DB_NAME", "postgres")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "5432")
 
-# Build DSN
-database_url = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Build DSN (pg8000 driver for sync); URL.create escapes special chars in credentials
+database_url = URL.create(
+    "postgresql+pg8000",
+    username=DB_USER,
+    password=DB_PASSWORD,
+    host=DB_HOST,
+    port=int(DB_PORT),
+    database=DB_NAME,
+)
+
+# asyncpg driver for routes that use AsyncSession
+async_database_url = database_url.set(drivername="postgresql+asyncpg")
+
+# Logged once at import; never includes the password
+logger.info(
+    "🚀 Running in %s mode → Connecting to %s@%s:%s/%s",
+    app_env, DB_USER, DB_HOST, DB_PORT, DB_NAME,
+)
+
+# ============================================================
+# Connection pool sizing
+# The sync and async engines each hold their own pool, so a process can
+# open up to DB_POOL_SIZE + DB_MAX_OVERFLOW + DB_ASYNC_POOL_SIZE +
+# DB_ASYNC_MAX_OVERFLOW connections (70 by default) — keep that sum
+# below Postgres max_connections.
+# ============================================================
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "10"))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
 
-# Force pg8000 driver for sync
-if database_url.startswith("postgresql://"):
-    database_url = database_url.replace("postgresql://", "postgresql+pg8000://", 1)
+# When fronted by PgBouncer (transaction mode), let it own pooling
+DB_USE_PGBOUNCER = os.getenv("DB_USE_PGBOUNCER", "false").lower() == "true"
 
-print(f"🚀 Running in {app_env} mode → Connecting to {database_url}")
+def _pool_kwargs(pool_size: int, max_overflow: int) -> dict:
+    if DB_USE_PGBOUNCER:
+        return {"poolclass": NullPool}
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_use_lifo": True,  # reuse the most recent (warm) backend first
+    }
 
 # ============================================================
 # SQLAlchemy setup (sync)
 # ============================================================
-engine = create_engine(database_url, pool_pre_ping=True)
+engine = create_engine(
+    database_url,
+    pool_pre_ping=True,
+    **_pool_kwargs(DB_POOL_SIZE, DB_MAX_OVERFLOW),
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Thread-local session registry for background jobs (scheduler workers);
+# call ScopedSession.remove() when the unit of work ends
+ScopedSession = scoped_session(SessionLocal)
 Base = declarative_base()
 
 def get_db():
@@ -42,3 +93,23 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# ============================================================
+# SQLAlchemy setup (async)
+# Background threads (scheduler, polling) keep using SessionLocal.
+# ============================================================
+async_engine = create_async_engine(
+    async_database_url,
+    pool_pre_ping=True,
+    # asyncpg's prepared-statement cache breaks under PgBouncer transaction mode
+    connect_args={"statement_cache_size": 0} if DB_USE_PGBOUNCER else {},
+    **_pool_kwargs(DB_ASYNC_POOL_SIZE, DB_ASYNC_MAX_OVERFLOW),
+)
+AsyncSessionLocal = sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+async def get_async_db():
+    """Yield an AsyncSession for async FastAPI routes."""
+    async with AsyncSessionLocal() as session:
+        yield session
@@ -1,38 +1,69 @@
 import os
 import json
+from functools import lru_cache
 from app.utils.mikrotik_config import MikroTikClient
 
 
+@lru_cache(maxsize=1)
+def _router_map() -> dict:
+    """Parse ROUTER_MAP_JSON once; env changes need clear_cache()."""
+    try:
+        return json.loads(os.getenv("ROUTER_MAP_JSON", "{}"))
+    except json.JSONDecodeError:
+        return {}
+
+
+@lru_cache(maxsize=1)
+def _creds() -> tuple[str, str]:
+    return os.getenv("MIKROTIK_USER", "admin"), os.getenv("MIKROTIK_PASS", "")
+
+
+@lru_cache(maxsize=1)
+def _routers() -> tuple:
+    """Build the MikroTikClient instances once and reuse them on every lookup."""
+    username, password = _creds()
+    return tuple(
+        {
+            "group": group,
+            "client": MikroTikClient(
+                host=host,
+                username=username,
+                password=password,
+            ),
+        }
+        for group, host in _router_map().items()
+    )
+
+
+@lru_cache(maxsize=1)
+def _index() -> tuple[dict, dict]:
+    """O(1) lookup tables: upper-cased group → client and host → client."""
+    by_group = {r["group"].upper(): r["client"] for r in _routers()}
+    by_host = {c.host: c for c in by_group.values()}
+    return by_group, by_host
+
+
+def clear_cache():
+    """Drop cached env config and clients (e.g. for tests that patch the env)."""
+    _router_map.cache_clear()
+    _creds.cache_clear()
+    _routers.cache_clear()
+    _index.cache_clear()
+
+
+def refresh():
+    """Re-read the environment and rebuild the router lookup tables."""
+    clear_cache()
+    _index()
+
+
 def get_mikrotik_clients():
     """
     ✅ Return a list of MikroTikClient instances for all routers defined in ROUTER_MAP_JSON.
     Example .env:
       ROUTER_MAP_JSON={"G1":"192.168.4.1","G2":"10.147.18.20"}
     """
-    routers = []
-
-    router_map_str = os.getenv("ROUTER_MAP_JSON", "{}")
-    try:
-        router_map = json.loads(router_map_str)
-    except json.JSONDecodeError:
-        router_map = {}
-
-    username = os.getenv("MIKROTIK_USER", "admin")
-    password = os.getenv("MIKROTIK_PASS", "")
-
-    for group, host in router_map.items():
-        routers.append(
-            {
-                "group": group,
-                "client": MikroTikClient(
-                    host=host,
-                    username=username,
-                    password=password,
-                ),
-            }
-        )
-
-    return routers
+    return list(_routers())
 
 
 def get_mikrotik(group: str | None = None, host: str | None = None):
@@ -42,23 +73,23 @@ def get_mikrotik(group: str | None = None, host: str | None = None):
     - If host is provided, match host IP (e.g., "192.168.4.1").
     - Otherwise, return the first router.
     """
-    routers = get_mikrotik_clients()
-    if not routers:
+    by_group, by_host = _index()
+    if not by_group:
         raise ValueError("⚠️ No MikroTik routers configured in environment.")
 
     # Match by group name
     if group:
-        for r in routers:
-            if r["group"].upper() == group.upper():
-                return r["client"]
-        raise ValueError(f"⚠️ No MikroTik found for group '{group}'")
+        try:
+            return by_group[group.upper()]
+        except KeyError:
+            raise ValueError(f"⚠️ No MikroTik found for group '{group}'") from None
 
     # Match by host/IP
     if host:
-        for r in routers:
-            if r["client"].host == host:
-                return r["client"]
-        raise ValueError(f"⚠️ No MikroTik found with host '{host}'")
+        try:
+            return by_host[host]
+        except KeyError:
+            raise ValueError(f"⚠️ No MikroTik found with host '{host}'") from None
 
     # Default: first router
-    return routers[0]["client"]
+    return next(iter(by_group.values()))
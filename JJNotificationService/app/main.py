@@ -1,14 +1,20 @@
 import os
 import sys
+import asyncio
 import logging
-from fastapi import FastAPI, WebSocket
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from app.routes import mikrotik, clients, templates, messages, message_logs
 from app.routes import system_monitor, force_billing, settings
 from app.websocket_manager import manager
-from app.services.app_lifecycle import start_all_lifecycles, load_all_mikrotiks
-from app.services.billing_service import BillingService
+
+if TYPE_CHECKING:
+    from app.services.billing_service import BillingService
 
 # ============================================================
 # 📝 Logging Config
@@ -20,10 +26,67 @@ logging.basicConfig(
 )
 logger = logging.getLogger("main")
 
+# ============================================================
+# 🚀 Lifecycle Management
+# ============================================================
+ENABLE_SCHEDULER = os.getenv("ENABLE_SCHEDULER", "true").lower() == "true"
+INSTANCE_ROLE = os.getenv("INSTANCE_ROLE", "main").lower()  # "main" or "replica"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background polling/billing on startup and stop it on shutdown."""
+    app.state.lifecycles = []
+    app.state.is_ready = False
+
+    logger.info("🚀 FastAPI startup (PID %d) — role: %s", os.getpid(), INSTANCE_ROLE)
+
+    if not ENABLE_SCHEDULER or INSTANCE_ROLE != "main":
+        logger.info("⏸️ Scheduler disabled for this instance.")
+    else:
+        try:
+            from app.services.app_lifecycle import start_all_lifecycles
+
+            logger.info("🧠 Initializing all MikroTik lifecycles...")
+            app.state.lifecycles = start_all_lifecycles()
+            logger.info("✅ %d MikroTik lifecycle(s) started successfully.", len(app.state.lifecycles))
+        except Exception as e:
+            logger.error("❌ Failed to start lifecycles: %s", e)
+
+    # Mark system as ready regardless of lifecycle failures
+    app.state.is_ready = True
+    logger.info("✅ Application marked as ready.")
+
+    try:
+        yield
+    finally:
+        logger.info("🛑 Shutting down — stopping all schedulers...")
+        for lifecycle in app.state.lifecycles:
+            try:
+                lifecycle.shutdown()
+            except Exception as e:
+                logger.warning("⚠️ Failed to stop lifecycle cleanly: %s", e)
+        from app.services.scheduler import shutdown_scheduler
+
+        if app.state.lifecycles:
+            from app.services.app_lifecycle import stop_sync_loop
+
+            stop_sync_loop()
+        shutdown_scheduler()
+        executor = getattr(app.state, "billing_executor", None)
+        if executor is not None:
+            executor.shutdown(wait=False)
+        logger.info("✅ All MikroTik schedulers stopped cleanly.")
+
+
 # ============================================================
 # 🚀 FastAPI App
 # ============================================================
-app = FastAPI(title="MikroTik Billing System")
+app = FastAPI(
+    title="MikroTik Billing System",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # ============================================================
 # 💓 Health & Readiness Checks
@@ -37,15 +100,13 @@ def health_check():
     """
     return {"status": "ok"}
 
-# This variable will be toggled once all lifecycles have started
-is_ready = False
-
 @app.get("/ready", tags=["system"])
-def readiness_check():
+def readiness_check(request: Request):
     """
     Returns OK only when the app has finished initializing lifecycles.
     Useful for orchestrators or dependency containers.
     """
+    is_ready = getattr(request.app.state, "is_ready", False)
     return {"status": "ready" if is_ready else "initializing"}
 
 # ============================================================
@@ -53,21 +114,24 @@ def readiness_check():
 # ============================================================
 ENV = os.getenv("ENV", "dev")
 
-if ENV == "dev":
+
+def _origins() -> tuple[str, ...]:
+    """CORS origins are fixed for the lifetime of the app."""
+    if ENV != "dev":
+        return ("*",)
     vite_api_base_url = os.getenv("VITE_API_BASE_URL", "http://localhost:5173")
-    origins = [
+    return (
         vite_api_base_url,
         "http://localhost",
         "http://localhost:80",
         "http://localhost:3000",
         "http://127.0.0.1",
-    ]
-else:
-    origins = ["*"]
+    )
+
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=origins,
+    allow_origins=list(_origins()),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -101,65 +165,56 @@ async def websocket_endpoint(websocket: WebSocket):
 # ============================================================
 # ⚡ Manual Billing Trigger (Admin / Testing Only)
 # ============================================================
+_BILLING: "dict[str, BillingService]" = {}
+
+
+def _get_billing(cfg: dict) -> "BillingService":
+    """Return the cached BillingService for this router, creating it once."""
+    from app.services.billing_service import BillingService
+
+    service = _BILLING.get(cfg["host"])
+    if service is None:
+        service = _BILLING.setdefault(
+            cfg["host"],
+            BillingService(cfg["host"], cfg["user"], cfg["password"], cfg["group_name"]),
+        )
+    return service
+
+
 @app.post("/billing/run/{mode}")
-def run_billing_now(mode: str):
+async def run_billing_now(mode: str, request: Request):
+    from app.services.app_lifecycle import load_all_mikrotiks
+
     routers = load_all_mikrotiks()
     if not routers:
         return {"message": "⚠️ No MikroTik routers configured."}
 
+    # ✅ Reuse one executor across calls; each router is an independent network round-trip
+    executor = getattr(request.app.state, "billing_executor", None)
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=min(32, len(routers)), thread_name_prefix="billing-run"
+        )
+        request.app.state.billing_executor = executor
+
+    loop = asyncio.get_running_loop()
+    tasks = [
+        loop.run_in_executor(
+            executor,
+            lambda cfg=cfg: _get_billing(cfg).run(mode),
+        )
+        for cfg in routers
+    ]
+    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+
     results = []
-    for cfg in routers:
-        billing_service = BillingService(cfg["host"], cfg["user"], cfg["password"])
-        try:
-            billing_service.run(mode)
+    for cfg, outcome in zip(routers, outcomes):
+        if isinstance(outcome, Exception):
+            results.append({"host": cfg["host"], "status": f"error: {outcome}"})
+        else:
             results.append({"host": cfg["host"], "status": "ok"})
-        except Exception as e:
-            results.append({"host": cfg["host"], "status": f"error: {e}"})
 
     return {
         "message": f"✅ Manual billing triggered ({mode}) for {len(routers)} router(s).",
         "results": results,
     }
-
-# ============================================================
-# 🚀 Lifecycle Management
-# ============================================================
-lifecycles = []
-ENABLE_SCHEDULER = os.getenv("ENABLE_SCHEDULER", "true").lower() == "true"
-INSTANCE_ROLE = os.getenv("INSTANCE_ROLE", "main").lower()  # "main" or "replica"
-
-
-@app.on_event("startup")
-def startup_event():
-    """Start background polling and billing for all MikroTik routers."""
-    global lifecycles, is_ready
-
-    logger.info(f"🚀 FastAPI startup (PID {os.getpid()}) — role: {INSTANCE_ROLE}")
-
-    if not ENABLE_SCHEDULER or INSTANCE_ROLE != "main":
-        logger.info("⏸️ Scheduler disabled for this instance.")
-        is_ready = True
-        return
-
-    try:
-        logger.info("🧠 Initializing all MikroTik lifecycles...")
-        lifecycles = start_all_lifecycles()
-        logger.info(f"✅ {len(lifecycles)} MikroTik lifecycle(s) started successfully.")
-    except Exception as e:
-        logger.error(f"❌ Failed to start lifecycles: {e}")
-    finally:
-        # Mark system as ready regardless of lifecycle failures
-        is_ready = True
-        logger.info("✅ Application marked as ready.")
-
-
-@app.on_event("shutdown")
-def shutdown_event():
-    """Stop all background schedulers cleanly."""
-    logger.info("🛑 Shutting down — stopping all schedulers...")
-    for lifecycle in lifecycles:
-        try:
-            lifecycle.shutdown()
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to stop lifecycle cleanly: {e}")
-    logger.info("✅ All MikroTik schedulers stopped cleanly.")
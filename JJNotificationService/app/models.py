@@ -1,12 +1,11 @@
 from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, \
-  Enum, Date, Float
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
-from sqlalchemy.ext.declarative import declarative_base
+  Enum, Date, Float, Index
+from sqlalchemy.orm import relationship, validates
+from sqlalchemy.sql import func, text
 import enum
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 
-Base = declarative_base()
+from app.database import Base
 
 
 # ------------------------------
@@ -40,24 +39,48 @@ class ConnectionName(str, enum.Enum):
 # ===============================
 class Client(Base):
     __tablename__ = "clients"
+    __table_args__ = (
+        Index("ix_clients_status_billing_date", "status", "billing_date"),
+        Index("ix_clients_group_state_conn", "group_name", "state", "connection_name"),
+        Index("ix_clients_conn_group", "connection_name", "group_name"),
+        Index(
+            "ix_clients_unpaid_billing_date",
+            "billing_date",
+            postgresql_where=text("status <> 'PAID'"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     messenger_id = Column(String, unique=True, nullable=False)
     group_name = Column(String, nullable=True)
     connection_name = Column(String, nullable=True)  # 🔑 link to MikroTik comment
+    connection_name_lc = Column(String, nullable=True)  # lowercased copy for netwatch matching
 
     # Network state
-    state = Column(Enum(ConnectionState), default=ConnectionState.UNKNOWN, nullable=False)
+    state = Column(
+        Enum(ConnectionState, name="connectionstate", native_enum=True),
+        default=ConnectionState.UNKNOWN,
+        nullable=False,
+    )
 
     # Billing fields
-    status = Column(Enum(BillingStatus), default=BillingStatus.PAID, nullable=False)
+    status = Column(
+        Enum(BillingStatus, name="billingstatus", native_enum=True),
+        default=BillingStatus.PAID,
+        nullable=False,
+    )
     speed_limit = Column(String, default="unlimited")  # ✅ default client bandwidth is open/unli
     amt_monthly = Column(Float, nullable=False, default=1000.0)
 
     # 🔥 Single recurring billing date
     billing_date = Column(Date, nullable=True, default=date.today)  # replaced day+month+year
 
+    @validates("connection_name")
+    def _sync_connection_name_lc(self, key, value):
+        self.connection_name_lc = value.lower() if value else None
+        return value
+
 # ===============================
 # 🚀 Client State history
 # ===============================
@@ -90,6 +113,10 @@ class Template(Base):
 # ===============================
 class MessageLog(Base):
     __tablename__ = "message_logs"
+    __table_args__ = (
+        Index("ix_message_logs_status_sent_at", "status", "sent_at"),
+        Index("ix_message_logs_sent_at", "sent_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -99,9 +126,10 @@ class MessageLog(Base):
 
     status = Column(String, default="pending", nullable=False)
 
+    # Filled client-side so inserts can be batched without a RETURNING round-trip
     created_at = Column(
         DateTime(timezone=True),
-        server_default=func.now(),
+        default=lambda: datetime.now(timezone.utc),
         nullable=False
     )
     sent_at = Column(DateTime(timezone=True), nullable=True)
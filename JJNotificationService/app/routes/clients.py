@@ -1,57 +1,108 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+import asyncio
+import logging
 import os
+import orjson
 import requests
 
-from app.database import SessionLocal
+from app.database import SessionLocal, get_async_db, get_db
 from app import models, schemas
 from app.websocket_manager import manager
+from app.services import clients_cache
 from app.utils.billing import (
+    billing_update_event,
     handle_paid_client,
     handle_unpaid_client,
 )
 from app.utils.messengerV2 import send_message
+from app.utils.graph_http import graph_session
 from app.models import BillingStatus
 
 router = APIRouter()
+logger = logging.getLogger("clients")
 
 FACEBOOK_GRAPH_URL = "https://graph.facebook.com/v23.0"
 ACCESS_TOKEN = os.getenv("PAGE_ACCESS_TOKEN")
 PAGE_ID = os.getenv("FACEBOOK_PAGE_ID")
+FB_SYNC_PAGE_LIMIT = int(os.getenv("FB_SYNC_PAGE_LIMIT", "100"))
+FB_SYNC_MAX_PAGES = int(os.getenv("FB_SYNC_MAX_PAGES", "50"))
 
+def _fetch_conversations() -> list:
+    """Fetch every conversation page, following Graph `paging.next` cursors."""
+    url = f"{FACEBOOK_GRAPH_URL}/me/conversations"
+    params = {
+        "fields": "participants",
+        "limit": FB_SYNC_PAGE_LIMIT,
+        "access_token": ACCESS_TOKEN,
+    }
+    data = []
+    for _ in range(FB_SYNC_MAX_PAGES):
+        response = graph_session.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        body = response.json()
+        data.extend(body.get("data", []))
 
-# -------------------------------
-# Dependency for DB session
-# -------------------------------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+        url = body.get("paging", {}).get("next")
+        if not url:
+            break
+        params = None  # `next` already carries the cursor, fields and token
+    return data
 
 
 # 🚀 Create a new client
 @router.post("/", response_model=schemas.ClientResponse)
-def create_client(client: schemas.ClientCreate, db: Session = Depends(get_db)):
-    db_client = models.Client(**client.dict())
+async def create_client(client: schemas.ClientCreate, db: AsyncSession = Depends(get_async_db)):
+    db_client = models.Client(**client.model_dump())
     db.add(db_client)
-    db.commit()
-    db.refresh(db_client)
+    await db.commit()
+    clients_cache.bump_version()
+    await db.refresh(db_client)
     return db_client
 
 
-# 🚀 Get all clients
+# 🚀 Get all clients (optional keyset pagination: ?limit=100&cursor=<last id>)
 @router.get("/", response_model=List[schemas.ClientResponse])
-def get_clients(db: Session = Depends(get_db)):
-    return db.query(models.Client).all()
+async def get_clients(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[int] = Query(None, description="Return clients with id > cursor"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # ✅ Full-list polling is served from the versioned cache
+    paginated = limit is not None or cursor is not None
+    version = clients_cache.current_version()
+    if not paginated:
+        cached = clients_cache.get(version)
+        if cached is not None:
+            return Response(content=cached, media_type="application/json")
+
+    stmt = select(models.Client)
+    if paginated:
+        # Keyset pages are only meaningful in id order
+        stmt = stmt.order_by(models.Client.id)
+    if cursor is not None:
+        stmt = stmt.where(models.Client.id > cursor)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    result = await db.execute(stmt)
+    clients = result.scalars().all()
+    if paginated:
+        return clients
+
+    body = orjson.dumps([schemas.ClientResponse.model_validate(c).model_dump() for c in clients])
+    clients_cache.put(version, body)
+    return Response(content=body, media_type="application/json")
 
 
 # 🚀 Get a client by ID
 @router.get("/{client_id}", response_model=schemas.ClientResponse)
-def get_client(client_id: int, db: Session = Depends(get_db)):
-    client = db.query(models.Client).filter(models.Client.id == client_id).first()
+async def get_client(client_id: int, db: AsyncSession = Depends(get_async_db)):
+    client = await db.get(models.Client, client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
     return client
@@ -59,16 +110,17 @@ def get_client(client_id: int, db: Session = Depends(get_db)):
 
 # 🚀 Update a client
 @router.put("/{client_id}", response_model=schemas.ClientResponse)
-async def update_client(client_id: int, client: schemas.ClientUpdate, db: Session = Depends(get_db)):
-    db_client = db.query(models.Client).filter(models.Client.id == client_id).first()
+async def update_client(client_id: int, client: schemas.ClientUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_client = await db.get(models.Client, client_id)
     if not db_client:
         raise HTTPException(status_code=404, detail="Client not found")
 
-    for key, value in client.dict(exclude_unset=True).items():
+    for key, value in client.model_dump(exclude_unset=True).items():
         setattr(db_client, key, value)
 
-    db.commit()
-    db.refresh(db_client)
+    await db.commit()
+    clients_cache.bump_version()
+    await db.refresh(db_client)
 
     await manager.broadcast({"id": db_client.id})
     return db_client
@@ -76,120 +128,252 @@ async def update_client(client_id: int, client: schemas.ClientUpdate, db: Sessio
 
 # 🚀 Delete a client
 @router.delete("/{client_id}", response_model=dict)
-def delete_client(client_id: int, db: Session = Depends(get_db)):
-    db_client = db.query(models.Client).filter(models.Client.id == client_id).first()
-    if not db_client:
+async def delete_client(client_id: int, db: AsyncSession = Depends(get_async_db)):
+    # ✅ Delete directly; rowcount tells us whether it existed (no row hydration)
+    result = await db.execute(
+        delete(models.Client)
+        .where(models.Client.id == client_id)
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
         raise HTTPException(status_code=404, detail="Client not found")
 
-    db.delete(db_client)
-    db.commit()
+    await db.commit()
+    clients_cache.bump_version()
     return {"message": "Client deleted successfully"}
 
 
 # 🚀 Bulk delete clients
 @router.delete("/", response_model=dict)
-def delete_clients(client_ids: List[int] = Query(...), db: Session = Depends(get_db)):
+async def delete_clients(client_ids: List[int] = Query(...), db: AsyncSession = Depends(get_async_db)):
     if not client_ids:
         raise HTTPException(status_code=400, detail="No client IDs provided")
 
-    deleted = db.query(models.Client).filter(models.Client.id.in_(client_ids)).delete(synchronize_session=False)
-    db.commit()
-    return {"message": f"✅ Deleted {deleted} client(s)"}
+    result = await db.execute(
+        delete(models.Client)
+        .where(models.Client.id.in_(client_ids))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    clients_cache.bump_version()
+    return {"message": f"✅ Deleted {result.rowcount} client(s)"}
 
 
 # ✅ Sync clients from Facebook Graph API
 @router.post("/sync", response_model=dict, status_code=status.HTTP_200_OK)
-def sync_clients(db: Session = Depends(get_db)):
+async def sync_clients(db: AsyncSession = Depends(get_async_db)):
     if not ACCESS_TOKEN:
         raise HTTPException(status_code=500, detail="Missing Facebook access token")
 
-    url = f"{FACEBOOK_GRAPH_URL}/me/conversations"
-    params = {"fields": "participants", "access_token": ACCESS_TOKEN}
-
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json().get("data", [])
+        # requests is blocking — keep it off the event loop
+        data = await run_in_threadpool(_fetch_conversations)
     except requests.RequestException as e:
         raise HTTPException(status_code=502, detail=f"Facebook API error: {str(e)}")
 
     if not data:
         return {"message": "⚠️ No conversations found"}
 
-    synced = 0
+    # Collect unique participants first (excluding our own page)
+    incoming = {}
     for convo in data:
-        participants = convo.get("participants", {}).get("data", [])
-        if not participants:
-            continue
-
-        for p in participants:
-            if PAGE_ID and p.get("id") == PAGE_ID:
-                continue
-            if not p.get("id"):
+        for p in convo.get("participants", {}).get("data", []):
+            pid = p.get("id")
+            if not pid or (PAGE_ID and pid == PAGE_ID):
                 continue
+            incoming.setdefault(pid, p.get("name") or "Unknown")
+
+    if not incoming:
+        return {"message": "✅ Synced 0 new client(s) from Facebook"}
+
+    # ✅ One round-trip to find which participants are already clients
+    result = await db.execute(
+        select(models.Client.messenger_id).where(models.Client.messenger_id.in_(incoming))
+    )
+    existing = set(result.scalars().all())
+
+    new_clients = [
+        models.Client(
+            name=name,
+            messenger_id=pid,
+            group_name="G1",
+            state="UNKNOWN",
+            billing_date=None,
+            status=BillingStatus.PAID.value,
+            speed_limit="Unlimited",
+            amt_monthly=0,
+        )
+        for pid, name in incoming.items()
+        if pid not in existing
+    ]
+    db.add_all(new_clients)
+    synced = len(new_clients)
+
+    try:
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    if synced:
+        clients_cache.bump_version()
+    return {"message": f"✅ Synced {synced} new client(s) from Facebook"}
 
-            existing = db.query(models.Client).filter(models.Client.messenger_id == p["id"]).first()
-            if not existing:
-                db_client = models.Client(
-                    name=p.get("name") or "Unknown",
-                    messenger_id=p["id"],
-                    group_name="G1",
-                    state="UNKNOWN",
-                    billing_date=None,
-                    status=BillingStatus.PAID.value,
-                    speed_limit="Unlimited",
-                    amt_monthly=0,
-                )
-                db.add(db_client)
-                synced += 1
 
+# -------------------------------
+# Payment helpers (blocking — run in the threadpool)
+# -------------------------------
+MSG_RESTORED = (
+    "Hi {name}, we received your payment of {amt}.\n"
+    "Your connection will be fully restored shortly. ✅ Thank you!"
+)
+MSG_THANKS = "Hi {name}, we received your payment of {amt}.\n{thanks}"
+_RESTORE_SET = frozenset({BillingStatus.LIMITED, BillingStatus.CUTOFF})
+
+
+def _payment_message(client: models.Client, prev_status, thanks: str) -> str:
+    template = MSG_RESTORED if prev_status in _RESTORE_SET else MSG_THANKS
+    return template.format(name=client.name, amt=client.amt_monthly, thanks=thanks)
+
+
+def _mark_paid(db: Session, clients: list, thanks: str) -> tuple[list, list]:
+    """
+    Apply PAID + router changes without committing.
+    Returns (messenger_id, text) pairs to notify and the per-client events
+    to broadcast once the caller's commit succeeds.
+    """
+    prev_statuses = {c.id: c.status for c in clients}
+    _set_status(db, clients, BillingStatus.PAID)
+
+    # Side effects only (router unblock, billing cycle) — status is already set
+    pending = []
+    for client in clients:
+        handle_paid_client(db, client, commit=False)
+
+        if client.messenger_id:
+            pending.append(
+                (client.messenger_id, _payment_message(client, prev_statuses[client.id], thanks))
+            )
+    return pending, [billing_update_event(c) for c in clients]
+
+
+def _mark_unpaid(db: Session, clients: list) -> list:
+    """Apply UNPAID + billing rules without committing; returns the events to broadcast."""
+    _set_status(db, clients, BillingStatus.UNPAID)
+    for client in clients:
+        handle_unpaid_client(db, client, "enforce", commit=False)
+    return [billing_update_event(c) for c in clients]
+
+
+def _set_status(db: Session, clients: list, new_status: BillingStatus):
+    """
+    One UPDATE for the batch's status; 'evaluate' keeps loaded objects in sync.
+    Per-client fields (billing_date, speed_limit) are flushed with the same commit.
+    """
+    if not clients:
+        return
+    db.execute(
+        update(models.Client)
+        .where(models.Client.id.in_([c.id for c in clients]))
+        .values(status=new_status)
+        .execution_options(synchronize_session="evaluate")
+    )
+
+
+def _shared_by_connection(db: Session, selected: list) -> tuple[list, set]:
+    """
+    Expand selected clients to everyone sharing their connection_name.
+    A NULL connection_name is not shared — those clients are only updated
+    themselves (same rule as _load_connection).
+    """
+    updated_connection_names = {c.connection_name for c in selected}
+    unnamed_ids = [c.id for c in selected if c.connection_name is None]
+
+    # ✅ One query for every shared connection instead of one per selected client
+    updated_clients = db.query(models.Client).filter(
+        or_(
+            models.Client.connection_name.in_(updated_connection_names - {None}),
+            models.Client.id.in_(unnamed_ids),
+        )
+    ).all()
+
+    return updated_clients, updated_connection_names
+
+
+def _send_payment_message(messenger_id: str, title: str, text: str) -> dict:
+    """Send one notice on its own session so sends can run concurrently."""
+    with SessionLocal() as db:
+        return send_message(db, messenger_id, title, text)
+
+
+async def _send_payment_messages(title: str, pending: list):
+    results = await asyncio.gather(
+        *(run_in_threadpool(_send_payment_message, mid, title, text) for mid, text in pending),
+        return_exceptions=True,
+    )
+    # One failed notice must not fail the request, but it must not vanish either
+    for (mid, _), result in zip(pending, results):
+        if isinstance(result, BaseException):
+            logger.error(f"❌ {title} notice to {mid} raised: {result!r}")
+        elif not (result.get("message_id") or result.get("skipped")):
+            logger.warning(f"⚠️ {title} notice to {mid} failed: {result.get('error', result)}")
+
+
+def _commit(db: Session):
+    """Commit or roll back and fail the request, so nothing is broadcast on error."""
     try:
         db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    clients_cache.bump_version()
 
-    return {"message": f"✅ Synced {synced} new client(s) from Facebook"}
 
+async def _broadcast_updates(events: list):
+    for event in events:
+        await manager.broadcast(event)
 
-# 🚀 Single Set Paid (now updates all shared connections)
-@router.post("/{client_id}/set_paid", response_model=dict)
-async def set_paid(client_id: int, db: Session = Depends(get_db)):
-    main_client = db.query(models.Client).filter(models.Client.id == client_id).first()
+
+def _load_connection(db: Session, client_id: int) -> tuple:
+    main_client = db.get(models.Client, client_id)
     if not main_client:
         raise HTTPException(status_code=404, detail="Client not found")
 
+    # NULL connection_name is not shared — don't sweep in every unnamed client
+    if main_client.connection_name is None:
+        return main_client, [main_client]
+
     # 🧩 Find all clients sharing the same connection name
     shared_clients = db.query(models.Client).filter(
         models.Client.connection_name == main_client.connection_name
     ).all()
+    return main_client, shared_clients
 
-    for client in shared_clients:
-        prev_status = client.status
-        client.status = BillingStatus.PAID
-        handle_paid_client(db, client)
 
-        # 💬 Notify if Messenger ID exists
-        if client.messenger_id:
-            if prev_status in [BillingStatus.LIMITED, BillingStatus.CUTOFF]:
-                msg = (
-                    f"Hi {client.name}, we received your payment of {client.amt_monthly}.\n"
-                    "Your connection will be fully restored shortly. ✅ Thank you!"
-                )
-            else:
-                msg = (
-                    f"Hi {client.name}, we received your payment of {client.amt_monthly}.\n"
-                    "✅ Thank you!"
-                )
-            send_message(db, client.messenger_id, "Payment Received", msg)
+def _load_selected(db: Session, client_ids: List[int]) -> list:
+    selected_clients = db.query(models.Client).filter(models.Client.id.in_(client_ids)).all()
+    if not selected_clients:
+        raise HTTPException(status_code=404, detail="No clients found")
+    return selected_clients
+
 
+# 🚀 Single Set Paid (now updates all shared connections)
+@router.post("/{client_id}/set_paid", response_model=dict)
+async def set_paid(client_id: int, db: Session = Depends(get_db)):
+    main_client, shared_clients = await run_in_threadpool(_load_connection, db, client_id)
+    pending, events = await run_in_threadpool(_mark_paid, db, shared_clients, "✅ Thank you!")
+    await run_in_threadpool(_commit, db)
+
+    # 📣 Only announce what was actually persisted
     await manager.broadcast({
         "event": "billing_update",
         "client_ids": [c.id for c in shared_clients],
         "status": BillingStatus.PAID.value,
     })
+    await _broadcast_updates(events)
 
-    db.commit()
+    # 💬 Notify everyone with a Messenger ID concurrently
+    await _send_payment_messages("Payment Received", pending)
     return {"message": f"✅ {len(shared_clients)} clients under {main_client.connection_name} marked as PAID"}
 
 # 🚀 Bulk Set Paid (shared connections aware)
@@ -198,80 +382,38 @@ async def set_paid_bulk(client_ids: List[int], db: Session = Depends(get_db)):
     if not client_ids:
         raise HTTPException(status_code=400, detail="No client IDs provided")
 
-    # Fetch selected clients
-    selected_clients = db.query(models.Client).filter(models.Client.id.in_(client_ids)).all()
-    if not selected_clients:
-        raise HTTPException(status_code=404, detail="No clients found")
-
-    updated_clients = []
-
-    # Track which connection_name groups we've already updated
-    updated_connection_names = set()
-
-    for client in selected_clients:
-        if client.connection_name in updated_connection_names:
-            continue  # already processed this shared connection
-
-        # Get all clients sharing this connection_name
-        shared_clients = db.query(models.Client).filter(
-            models.Client.connection_name == client.connection_name
-        ).all()
-
-        for c in shared_clients:
-            prev_status = c.status
-            c.status = BillingStatus.PAID
-            handle_paid_client(db, c)
+    selected_clients = await run_in_threadpool(_load_selected, db, client_ids)
+    updated_clients, updated_connection_names = await run_in_threadpool(
+        _shared_by_connection, db, selected_clients
+    )
+    pending, events = await run_in_threadpool(_mark_paid, db, updated_clients, "Thank you!")
 
-            # Messenger notification
-            if c.messenger_id:
-                if prev_status in [BillingStatus.LIMITED, BillingStatus.CUTOFF]:
-                    msg = (
-                        f"Hi {c.name}, we received your payment of {c.amt_monthly}.\n"
-                        "Your connection will be fully restored shortly. ✅ Thank you!"
-                    )
-                else:
-                    msg = (
-                        f"Hi {c.name}, we received your payment of {c.amt_monthly}.\n"
-                        "Thank you!"
-                    )
-                send_message(db, c.messenger_id, "Payment Received Bulk", msg)
-
-        updated_connection_names.add(client.connection_name)
-        updated_clients.extend(shared_clients)
-
-    db.commit()
+    await run_in_threadpool(_commit, db)
 
     await manager.broadcast({
         "event": "billing_update_bulk",
         "client_ids": [c.id for c in updated_clients],
         "status": BillingStatus.PAID.value,
     })
+    await _broadcast_updates(events)
 
+    await _send_payment_messages("Payment Received Bulk", pending)
     return {"message": f"✅ {len(updated_clients)} clients marked as PAID across {len(updated_connection_names)} shared connections"}
 
 
 # 🚀 Single Set Unpaid (also updates shared connections)
 @router.post("/{client_id}/set_unpaid", response_model=dict)
 async def set_unpaid(client_id: int, db: Session = Depends(get_db)):
-    main_client = db.query(models.Client).filter(models.Client.id == client_id).first()
-    if not main_client:
-        raise HTTPException(status_code=404, detail="Client not found")
-
-    shared_clients = db.query(models.Client).filter(
-        models.Client.connection_name == main_client.connection_name
-    ).all()
-
-    for client in shared_clients:
-        client.status = BillingStatus.UNPAID
-        handle_unpaid_client(db, client, "enforce")
-
-    db.commit()
+    main_client, shared_clients = await run_in_threadpool(_load_connection, db, client_id)
+    events = await run_in_threadpool(_mark_unpaid, db, shared_clients)
+    await run_in_threadpool(_commit, db)
 
     await manager.broadcast({
         "event": "billing_update",
         "client_ids": [c.id for c in shared_clients],
         "status": BillingStatus.UNPAID.value,
     })
+    await _broadcast_updates(events)
 
     return {"message": f"⚠️ {len(shared_clients)} clients under {main_client.connection_name} marked as UNPAID"}
 
@@ -282,34 +424,18 @@ async def set_unpaid_bulk(client_ids: List[int], db: Session = Depends(get_db)):
     if not client_ids:
         raise HTTPException(status_code=400, detail="No client IDs provided")
 
-    selected_clients = db.query(models.Client).filter(models.Client.id.in_(client_ids)).all()
-    if not selected_clients:
-        raise HTTPException(status_code=404, detail="No clients found")
-
-    updated_clients = []
-    updated_connection_names = set()
-
-    for client in selected_clients:
-        if client.connection_name in updated_connection_names:
-            continue  # already processed this shared connection
-
-        shared_clients = db.query(models.Client).filter(
-            models.Client.connection_name == client.connection_name
-        ).all()
-
-        for c in shared_clients:
-            c.status = BillingStatus.UNPAID
-            handle_unpaid_client(db, c, "enforce")
-
-        updated_connection_names.add(client.connection_name)
-        updated_clients.extend(shared_clients)
-
-    db.commit()
+    selected_clients = await run_in_threadpool(_load_selected, db, client_ids)
+    updated_clients, updated_connection_names = await run_in_threadpool(
+        _shared_by_connection, db, selected_clients
+    )
+    events = await run_in_threadpool(_mark_unpaid, db, updated_clients)
+    await run_in_threadpool(_commit, db)
 
     await manager.broadcast({
         "event": "billing_update_bulk",
         "client_ids": [c.id for c in updated_clients],
         "status": BillingStatus.UNPAID.value,
     })
+    await _broadcast_updates(events)
 
     return {"message": f"⚠️ {len(updated_clients)} clients marked as UNPAID across {len(updated_connection_names)} shared connections"}
@@ -1,18 +1,19 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-import threading
 import logging
 from datetime import datetime, timedelta
 import pytz
 
-from app.database import get_db
+from app.database import SessionLocal, get_db
 from app.utils.billing import check_billing, apply_billing_to_client
 from app.models import Client
+from app.services.scheduler import ensure_started
 
 router = APIRouter(prefix="/force", tags=["Billing Control"])
 logger = logging.getLogger("force_billing")
 
 PH_TZ = pytz.timezone("Asia/Manila")
+ENFORCE_DELAY = timedelta(hours=1)
 
 # ==========================================================
 # 🔔 Force Notification + Auto-Enforce After 1 Hour
@@ -46,11 +47,19 @@ def force_billing_run(
 
     # Step 2: Schedule enforcement after 1 hour
     if mode == "notification":
-        timer = threading.Timer(3600, delayed_enforce, args=(get_db, group))
-        timer.daemon = True
-        timer.start()
-
-        run_time = (datetime.now(PH_TZ) + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S %Z")
+        run_at = datetime.now(PH_TZ) + ENFORCE_DELAY
+        # One pending enforce per group — re-triggering just moves it
+        ensure_started().add_job(
+            delayed_enforce,
+            "date",
+            run_date=run_at,
+            args=[SessionLocal, group],
+            id=f"force_enforce_{group or 'all'}",
+            replace_existing=True,
+            misfire_grace_time=3600,
+        )
+
+        run_time = run_at.strftime("%Y-%m-%d %H:%M:%S %Z")
         logger.info(f"🕒 Enforce scheduled for {run_time} (group='{group}')")
 
         return {
@@ -72,7 +81,7 @@ def force_billing_run(
 def delayed_enforce_client(db_session_factory, client_id: int):
     db = db_session_factory()
     try:
-        client = db.query(Client).filter(Client.id == client_id).first()
+        client = db.get(Client, client_id)
         if not client:
             logger.warning(f"Client {client_id} not found for delayed enforce.")
             return
@@ -95,7 +104,7 @@ def force_billing_client(
     Apply billing manually for a single client.
     If mode='notification', enforcement will automatically follow after 1 hour.
     """
-    client = db.query(Client).filter(Client.id == client_id).first()
+    client = db.get(Client, client_id)
     if not client:
         return {"error": "Client not found"}
 
@@ -104,11 +113,18 @@ def force_billing_client(
 
     # Step 2: Schedule enforcement after 1 hour
     if mode == "notification":
-        timer = threading.Timer(3600, delayed_enforce_client, args=(get_db, client_id))
-        timer.daemon = True
-        timer.start()
-
-        run_time = (datetime.now(PH_TZ) + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S %Z")
+        run_at = datetime.now(PH_TZ) + ENFORCE_DELAY
+        ensure_started().add_job(
+            delayed_enforce_client,
+            "date",
+            run_date=run_at,
+            args=[SessionLocal, client_id],
+            id=f"force_enforce_client_{client_id}",
+            replace_existing=True,
+            misfire_grace_time=3600,
+        )
+
+        run_time = run_at.strftime("%Y-%m-%d %H:%M:%S %Z")
         logger.info(f"🕒 Enforce scheduled for {run_time} (client='{client.name}')")
 
         return {
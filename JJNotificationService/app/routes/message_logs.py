@@ -1,59 +1,70 @@
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, schemas
-from app.database import SessionLocal
+from app.database import get_async_db
 
 router = APIRouter()
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
-
-# ✅ Get all message logs
+# ✅ Get all message logs (optional keyset pagination: ?limit=100&cursor=<last id>)
 @router.get("/", response_model=List[schemas.MessageLogResponse])
-def get_message_logs(db: Session = Depends(get_db)):
-    logs = db.query(models.MessageLog).all()
-    return logs
+async def get_message_logs(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[int] = Query(None, description="Return logs with id > cursor"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    stmt = select(models.MessageLog)
+    if limit is not None or cursor is not None:
+        # Keyset pages are only meaningful in id order
+        stmt = stmt.order_by(models.MessageLog.id)
+    if cursor is not None:
+        stmt = stmt.where(models.MessageLog.id > cursor)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    result = await db.execute(stmt)
+    return result.scalars().all()
 
 
 # ✅ Delete all logs — placed BEFORE /{log_id} to prevent 422 error
 @router.delete("/all", response_model=dict)
-def delete_all_message_logs(db: Session = Depends(get_db)):
-    total_logs = db.query(models.MessageLog).count()
+async def delete_all_message_logs(db: AsyncSession = Depends(get_async_db)):
+    # rowcount replaces a separate COUNT(*) scan
+    result = await db.execute(delete(models.MessageLog))
+    total_logs = result.rowcount
     if total_logs == 0:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="No logs found to delete")
 
-    db.query(models.MessageLog).delete()
-    db.commit()
+    await db.commit()
     return {"message": f"Deleted all ({total_logs}) message logs successfully"}
 
 
 # ✅ Bulk delete logs (using query param IDs)
 @router.delete("/", response_model=dict)
-def delete_message_logs(
+async def delete_message_logs(
     log_ids: List[int] = Query(..., description="IDs of logs to delete"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    logs = db.query(models.MessageLog).filter(models.MessageLog.id.in_(log_ids)).all()
-    if not logs:
+    # ✅ One DELETE statement; no rows loaded just to be discarded
+    result = await db.execute(
+        delete(models.MessageLog)
+        .where(models.MessageLog.id.in_(log_ids))
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
         raise HTTPException(status_code=404, detail="No logs found to delete")
 
-    for log in logs:
-        db.delete(log)
-    db.commit()
-    return {"message": f"Deleted {len(logs)} logs successfully"}
+    await db.commit()
+    return {"message": f"Deleted {result.rowcount} logs successfully"}
 
 
 # ✅ Get single message log
 @router.get("/{log_id}", response_model=schemas.MessageLogResponse)
-def get_message_log(log_id: int, db: Session = Depends(get_db)):
-    log = db.query(models.MessageLog).filter(models.MessageLog.id == log_id).first()
+async def get_message_log(log_id: int, db: AsyncSession = Depends(get_async_db)):
+    log = await db.get(models.MessageLog, log_id)
     if not log:
         raise HTTPException(status_code=404, detail="Message log not found")
     return log
@@ -61,11 +72,14 @@ def get_message_log(log_id: int, db: Session = Depends(get_db)):
 
 # ✅ Delete single message log
 @router.delete("/{log_id}", response_model=dict)
-def delete_message_log(log_id: int, db: Session = Depends(get_db)):
-    log = db.query(models.MessageLog).filter(models.MessageLog.id == log_id).first()
-    if not log:
+async def delete_message_log(log_id: int, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(
+        delete(models.MessageLog)
+        .where(models.MessageLog.id == log_id)
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
         raise HTTPException(status_code=404, detail="Message log not found")
 
-    db.delete(log)
-    db.commit()
+    await db.commit()
     return {"message": f"Message log {log_id} deleted successfully"}
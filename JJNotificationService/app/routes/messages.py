@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List
-from app.database import SessionLocal
+from app.database import get_db
 from app import models
 from app.schemas import SendRequest
 from app.utils.messengerV2 import send_message
@@ -10,13 +10,6 @@ from datetime import datetime
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 
 @router.post("/send")
 def send_to_clients(payload: SendRequest, db: Session = Depends(get_db)):
@@ -28,12 +21,23 @@ def send_to_clients(payload: SendRequest, db: Session = Depends(get_db)):
     if not message:
         return {"error": "Message is empty"}
 
+    # ✅ Resolve every recipient in one query (only the columns we need)
+    recipients = {
+        row.id: row
+        for row in db.query(
+            models.Client.id, models.Client.name, models.Client.messenger_id
+        ).filter(models.Client.id.in_(payload.client_ids))
+    }
+
     results = []
     for cid in payload.client_ids:
-        client = db.query(models.Client).filter(models.Client.id == cid).first()
+        client = recipients.get(cid)
         if client:
-            resp = send_message(db, client.messenger_id, title, message)
+            resp = send_message(db, client.messenger_id, title, message, commit=False)
 
             results.append({"client": client.name, "status": resp})
 
+    # ✅ Persist all MessageLog rows in one transaction
+    db.commit()
+
     return {"results": results}
@@ -1,110 +1,193 @@
 import time
-import threading
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.job import Job
 from fastapi import APIRouter, Query
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
 from app import models
 from app.utils.messenger import send_message
+from app.services.scheduler import MANILA_TZ, ensure_started
+from app.services.template_service import get_template_by_title
 
 router = APIRouter()
 logger = logging.getLogger("mikrotik")
 
-# --- DB session ---
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # --- Debounce / Stability config ---
-last_state = {}          # Current detected state
-notified_state = {}      # Last actually sent state
-timers = {}              # Running debounce timers
-last_changes = {}        # List of timestamps for recent changes
-unstable_until = {}      # Timestamp until which UPs are ignored
-
 DELAY = 180              # 3 minutes debounce (180s)
 FLAP_THRESHOLD = 4       # Number of changes that defines instability
 FLAP_WINDOW = 300        # 5 minutes window to check instability
-
-
-def notify_clients(db: Session, template_name: str, connection_name: str = None, group_name: str = None):
-    template = db.query(models.Template).filter(models.Template.title == template_name).first()
+STATE_CACHE_MAX = 10_000  # Max tracked connection/group keys (LRU)
+MSG_WORKERS = 32         # Max concurrent Messenger sends per fan-out
+NOTIFY_BATCH = 500       # Rows fetched per batch when streaming recipients
+
+# Shared, bounded pool: threads are created on demand up to MSG_WORKERS
+_MSG_POOL = ThreadPoolExecutor(max_workers=MSG_WORKERS, thread_name_prefix="msg")
+
+
+@dataclass
+class KeyState:
+    last: Optional[str] = None          # Current detected state
+    notified: Optional[str] = None      # Last actually sent state
+    job: Optional[Job] = None           # Pending debounce job (APScheduler)
+    changes: deque = field(default_factory=lambda: deque(maxlen=FLAP_THRESHOLD))  # Recent change timestamps
+    unstable_until: float = 0.0         # Timestamp until which UPs are ignored
+    ts: float = 0.0                     # Last time this key was touched
+
+
+_states: "OrderedDict[str, KeyState]" = OrderedDict()
+_states_lock = threading.Lock()
+
+
+def _drop_job(state: KeyState):
+    if state.job is not None:
+        try:
+            state.job.remove()
+        except JobLookupError:
+            pass  # already ran or was replaced
+        state.job = None
+
+
+def get_state(state_key: str) -> KeyState:
+    """Fetch (or create) the entry for a key, renewing its LRU position."""
+    with _states_lock:
+        state = _states.get(state_key)
+        if state is None:
+            state = _states[state_key] = KeyState()
+            if len(_states) > STATE_CACHE_MAX:
+                # ✅ Evict the least recently touched key and its pending job
+                _, evicted = _states.popitem(last=False)
+                _drop_job(evicted)
+        else:
+            _states.move_to_end(state_key)
+        state.ts = time.time()
+        return state
+
+
+def notify_clients(
+    db: Session,
+    template_name: str,
+    *,
+    filter_by_connection: bool,
+    connection_name: str = None,
+    group_name: str = None,
+):
+    template = get_template_by_title(db, template_name)
     if not template:
         logger.warning(f"Template '{template_name}' not found")
         return
 
-    query = db.query(models.Client)
-    if connection_name and not connection_name.startswith("ISP"):
+    # Only the recipient id is needed — no full Client hydration
+    query = db.query(models.Client.messenger_id)
+    if filter_by_connection:
         query = query.filter(models.Client.connection_name == connection_name)
     if group_name:
         query = query.filter(models.Client.group_name == group_name)
 
-    clients = query.all()
-    for client in clients:
-        resp = send_message(client.messenger_id, template.content)
-        log = models.MessageLog(
-            client_id=client.id,
-            template_id=template.id,
-            status=resp.get("message_id", "failed"),
-        )
-        db.add(log)
-        db.commit()
-    logger.info(f"✅ Sent '{template_name}' to {len(clients)} clients")
-
-
-def schedule_notify(state_key, template_name, connection_name, group_name, new_state):
-    """Debounce and handle stability detection"""
+    # ✅ Fan out the Graph API calls in parallel (N·RTT → ~RTT), submitting
+    # while rows are still being fetched in batches
+    futures = [
+        _MSG_POOL.submit(send_message, messenger_id, template.content, template.message_json)
+        for (messenger_id,) in query.yield_per(NOTIFY_BATCH)
+    ]
+    logs = []
+    for future in futures:
+        try:
+            resp = future.result(timeout=15)
+        except Exception as e:
+            logger.error(f"Messenger send failed: {e}")
+            resp = {}
+        is_sent = bool(resp.get("message_id"))
+        logs.append(models.MessageLog(
+            title=template.title,
+            message=template.content,
+            status="sent" if is_sent else "failed",
+            sent_at=datetime.utcnow() if is_sent else None,
+        ))
+
+    # ✅ One transaction for the whole fan-out
+    db.add_all(logs)
+    db.commit()
+    logger.info(f"✅ Sent '{template_name}' to {len(futures)} clients")
+
+
+def _confirm_and_notify(state_key, template_name, connection_name, group_name, new_state):
+    """Runs DELAY seconds after the last event for this key (scheduler job)."""
+    with _states_lock:
+        state = _states.get(state_key)
+    if state is None:
+        logger.info(f"[{state_key}] State evicted before stability delay, aborting send.")
+        return
+    state.job = None
 
-    def task():
-        logger.info(f"[{state_key}] Waiting {DELAY}s before confirming {new_state}")
-        time.sleep(DELAY)
+    # Still same state after waiting?
+    if state.last != new_state:
+        logger.info(f"[{state_key}] State changed before stability delay, aborting send.")
+        return
 
-        # Still same state after waiting?
-        if last_state.get(state_key) != new_state:
-            logger.info(f"[{state_key}] State changed before stability delay, aborting send.")
+    prev_sent = state.notified
+    if new_state == "UP":
+        # Skip UP if currently unstable
+        now = time.time()
+        if state.unstable_until > now:
+            logger.info(f"[{state_key}] Skipping UP notification (still unstable until {time.ctime(state.unstable_until)})")
             return
 
-        prev_sent = notified_state.get(state_key)
-        if new_state == "UP":
-            # Skip UP if currently unstable
-            now = time.time()
-            if unstable_until.get(state_key, 0) > now:
-                logger.info(f"[{state_key}] Skipping UP notification (still unstable until {time.ctime(unstable_until[state_key])})")
-                return
-
-        if prev_sent != new_state:
-            db = SessionLocal()
-            try:
-                notify_clients(db, template_name, connection_name, group_name)
-                notified_state[state_key] = new_state
-            finally:
-                db.close()
-        else:
-            logger.info(f"[{state_key}] {new_state} already notified before, skipping duplicate.")
+    if prev_sent != new_state:
+        with SessionLocal() as db:
+            notify_clients(
+                db,
+                template_name,
+                # ISP-wide templates go to the whole group
+                filter_by_connection=bool(connection_name) and not connection_name.startswith("ISP"),
+                connection_name=connection_name,
+                group_name=group_name,
+            )
+        state.notified = new_state
+    else:
+        logger.info(f"[{state_key}] {new_state} already notified before, skipping duplicate.")
+
+
+def schedule_notify(state: KeyState, state_key, template_name, connection_name, group_name, new_state):
+    """Debounce and handle stability detection"""
+    if state.notified == new_state:
+        # Reverted within the debounce window — cancel the pending job outright
+        # instead of letting it wake up just to skip a duplicate
+        _drop_job(state)
+        logger.info(f"[{state_key}] Back to notified state {new_state}, pending notification cancelled.")
+        return
 
-    # Cancel old timer if running
-    if timers.get(state_key) and timers[state_key].is_alive():
-        timers[state_key] = None  # mark replaced
+    logger.info(f"[{state_key}] Waiting {DELAY}s before confirming {new_state}")
 
-    t = threading.Thread(target=task, daemon=True)
-    timers[state_key] = t
-    t.start()
+    # ✅ One pending job per key — a new event replaces (resets) the previous one
+    state.job = ensure_started().add_job(
+        _confirm_and_notify,
+        "date",
+        run_date=datetime.now(MANILA_TZ) + timedelta(seconds=DELAY),
+        args=[state_key, template_name, connection_name, group_name, new_state],
+        id=f"notify_{state_key}",
+        replace_existing=True,
+        misfire_grace_time=DELAY,
+    )
 
 
-def record_change(state_key):
+def record_change(state: KeyState, state_key):
     """Track rapid state changes to detect flapping"""
     now = time.time()
-    changes = last_changes.get(state_key, [])
-    changes = [ts for ts in changes if now - ts < FLAP_WINDOW]  # keep only recent changes
+    changes = state.changes
+    while changes and now - changes[0] >= FLAP_WINDOW:  # drop expired from the left only
+        changes.popleft()
     changes.append(now)
-    last_changes[state_key] = changes
 
     if len(changes) >= FLAP_THRESHOLD:
-        unstable_until[state_key] = now + DELAY  # wait another 3 min after last change
-        logger.warning(f"[{state_key}] ⚠️ Detected flapping ({len(changes)} changes). Marked unstable until {time.ctime(unstable_until[state_key])}.")
+        state.unstable_until = now + DELAY  # wait another 3 min after last change
+        logger.warning(f"[{state_key}] ⚠️ Detected flapping ({len(changes)} changes). Marked unstable until {time.ctime(state.unstable_until)}.")
 
 
 # --- Endpoints ---
@@ -115,11 +198,12 @@ def mikrotik_down(
 ):
     key = f"{connection_name}_{group_name}"
     template_name = f"{connection_name}-DOWN"
-    last_state[key] = "DOWN"
-    record_change(key)
+    state = get_state(key)
+    state.last = "DOWN"
+    record_change(state, key)
 
     logger.info(f"[{key}] DOWN detected")
-    schedule_notify(key, template_name, connection_name, group_name, "DOWN")
+    schedule_notify(state, key, template_name, connection_name, group_name, "DOWN")
     return {"status": f"scheduled {template_name} after {DELAY}s if stable"}
 
 
@@ -130,9 +214,10 @@ def mikrotik_up(
 ):
     key = f"{connection_name}_{group_name}"
     template_name = f"{connection_name}-UP"
-    last_state[key] = "UP"
-    record_change(key)
+    state = get_state(key)
+    state.last = "UP"
+    record_change(state, key)
 
     logger.info(f"[{key}] UP detected")
-    schedule_notify(key, template_name, connection_name, group_name, "UP")
+    schedule_notify(state, key, template_name, connection_name, group_name, "UP")
     return {"status": f"scheduled {template_name} after {DELAY}s if stable"}
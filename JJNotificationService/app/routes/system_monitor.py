@@ -1,10 +1,43 @@
+from dataclasses import dataclass
+from typing import Optional
 from fastapi import APIRouter
-import psutil, os, time, platform
+import psutil, os, time, platform, threading
 
 router = APIRouter()
 
+STATUS_TTL = 2.0          # seconds a /system-status payload stays fresh
+CPU_SAMPLE_INTERVAL = 2.0  # background CPU sampling period
+
+# Boot time and uname never change for the life of the process
+BOOT_TIME = psutil.boot_time()
+_UNAME = platform.uname()._asdict()
+_GIB = 1 << 30
+_MIB = 1 << 20
+
+_cached = (0.0, None)     # (monotonic ts, payload)
+_cache_lock = threading.Lock()
+_cpu_percent = 0.0
+_cpu_thread = None
+
+
+def _sample_cpu():
+    """Keep a fresh CPU % without blocking requests on psutil's interval sleep."""
+    global _cpu_percent
+    psutil.cpu_percent(interval=None)  # prime the counters
+    while True:
+        time.sleep(CPU_SAMPLE_INTERVAL)
+        _cpu_percent = psutil.cpu_percent(interval=None)
+
+
+def _ensure_cpu_sampler():
+    global _cpu_thread
+    if _cpu_thread is None:
+        _cpu_thread = threading.Thread(target=_sample_cpu, name="cpu-sampler", daemon=True)
+        _cpu_thread.start()
+
+
 def get_uptime():
-    uptime_seconds = time.time() - psutil.boot_time()
+    uptime_seconds = time.time() - BOOT_TIME
     days = int(uptime_seconds // (24 * 3600))
     hours = int((uptime_seconds % (24 * 3600)) // 3600)
     minutes = int((uptime_seconds % 3600) // 60)
@@ -12,46 +45,106 @@ def get_uptime():
 
 @router.get("/system-status")
 def get_system_status():
-    cpu_percent = psutil.cpu_percent(interval=0.5)
+    global _cached
+    with _cache_lock:
+        ts, payload = _cached
+        if payload is not None and time.monotonic() - ts < STATUS_TTL:
+            return payload
+
+        _ensure_cpu_sampler()
+        payload = _collect_status()
+        _cached = (time.monotonic(), payload)
+        return payload
+
+
+@dataclass
+class SystemSnapshot:
+    cpu: float
+    mem_total: int
+    mem_used: int
+    mem_percent: float
+    disk_total: int
+    disk_used: int
+    disk_percent: float
+    temperature: Optional[float]
+    rx_bytes: int
+    zram_used: int
+    zram_total: int
+
+
+# Tiny sysfs files: open once, pread() on every refresh
+ZRAM_USED_PATH = "/sys/block/zram0/mem_used_total"
+ZRAM_SIZE_PATH = "/sys/block/zram0/disksize"
+THERMAL_PATH = "/sys/class/thermal/thermal_zone0/temp"
+_fds: dict = {}
+
+
+def _read_int(path: str) -> Optional[int]:
+    fd = _fds.get(path)
+    try:
+        if fd is None:
+            fd = _fds[path] = os.open(path, os.O_RDONLY)
+        return int(os.pread(fd, 32, 0).strip())
+    except (OSError, ValueError):
+        _fds.pop(path, None)
+        return None
+
+
+def _cpu_temperature() -> Optional[float]:
+    millideg = _read_int(THERMAL_PATH)
+    if millideg is not None:
+        return millideg / 1000
+
+    # Fallback: walk psutil sensors (depends on Orange Pi kernel sensors)
+    temps = psutil.sensors_temperatures()
+    if "cpu_thermal" in temps:
+        return temps["cpu_thermal"][0].current
+    if "soc_thermal" in temps:
+        return temps["soc_thermal"][0].current
+    return None
+
+
+def _snapshot() -> SystemSnapshot:
     memory = psutil.virtual_memory()
     disk = psutil.disk_usage("/")
-    temps = psutil.sensors_temperatures()
+    return SystemSnapshot(
+        cpu=_cpu_percent,
+        mem_total=memory.total,
+        mem_used=memory.used,
+        mem_percent=memory.percent,
+        disk_total=disk.total,
+        disk_used=disk.used,
+        disk_percent=disk.percent,
+        temperature=_cpu_temperature(),
+        rx_bytes=psutil.net_io_counters().bytes_recv,
+        zram_used=_read_int(ZRAM_USED_PATH) or 0,
+        zram_total=_read_int(ZRAM_SIZE_PATH) or 0,
+    )
 
-    # CPU temp (depends on Orange Pi kernel sensors)
-    cpu_temp = None
-    if "cpu_thermal" in temps:
-        cpu_temp = temps["cpu_thermal"][0].current
-    elif "soc_thermal" in temps:
-        cpu_temp = temps["soc_thermal"][0].current
+
+def _collect_status():
+    snap = _snapshot()
 
     # Network RX
-    net = psutil.net_io_counters()
-    rx_today = round(net.bytes_recv / (1024 ** 3), 2)  # GiB
+    rx_today = round(snap.rx_bytes / _GIB, 2)  # GiB
 
     # Optional: ZRAM (if /dev/zram0 exists)
-    zram_total = zram_used = 0
-    if os.path.exists("/sys/block/zram0/"):
-        try:
-            with open("/sys/block/zram0/mem_used_total") as f:
-                zram_used = int(f.read().strip()) / 1024**2
-            with open("/sys/block/zram0/disksize") as f:
-                zram_total = int(f.read().strip()) / 1024**2
-        except:
-            pass
+    zram_used = snap.zram_used / _MIB
+    zram_total = snap.zram_total / _MIB
 
     return {
-        "cpu": cpu_percent,
+        "cpu": snap.cpu,
         "memory": {
-            "total": round(memory.total / 1024**3, 2),
-            "used": round(memory.used / 1024**3, 2),
-            "percent": memory.percent,
+            "total": round(snap.mem_total / _GIB, 2),
+            "used": round(snap.mem_used / _GIB, 2),
+            "percent": snap.mem_percent,
         },
         "disk": {
-            "total": round(disk.total / 1024**3, 2),
-            "used": round(disk.used / 1024**3, 2),
-            "percent": disk.percent,
+            "total": round(snap.disk_total / _GIB, 2),
+            "used": round(snap.disk_used / _GIB, 2),
+            "percent": snap.disk_percent,
         },
-        "temperature": cpu_temp,
+        "temperature": snap.temperature,
         "uptime": get_uptime(),
         "rx_today": f"{rx_today} GiB",
         "zram": {
@@ -59,5 +152,5 @@ def get_system_status():
             "total": round(zram_total / 1024, 1),
             "percent": round((zram_used / zram_total * 100), 1) if zram_total else 0,
         },
-        "system": platform.uname()._asdict(),
+        "system": _UNAME,
     }
@@ -3,44 +3,38 @@
 # ===================================
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import SessionLocal
+from app.database import get_async_db
 from app import models, schemas
+from app.services.template_service import invalidate_template_cache
 
 router = APIRouter()
 
-# -------------------------------
-# Dependency for DB session
-# -------------------------------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 
 # 🚀 Create template
 @router.post("/", response_model=schemas.TemplateResponse)
-def create_template(template: schemas.TemplateCreate, db: Session = Depends(get_db)):
-    db_template = models.Template(**template.dict())
+async def create_template(template: schemas.TemplateCreate, db: AsyncSession = Depends(get_async_db)):
+    db_template = models.Template(**template.model_dump())
     db.add(db_template)
-    db.commit()
-    db.refresh(db_template)
+    await db.commit()
+    invalidate_template_cache(db_template.title)
+    await db.refresh(db_template)
     return db_template
 
 
 # 🚀 List all templates
 @router.get("/", response_model=List[schemas.TemplateResponse])
-def list_templates(db: Session = Depends(get_db)):
-    return db.query(models.Template).all()
+async def list_templates(db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(models.Template))
+    return result.scalars().all()
 
 
 # 🚀 Get single template
 @router.get("/{template_id}", response_model=schemas.TemplateResponse)
-def get_template(template_id: int, db: Session = Depends(get_db)):
-    template = db.query(models.Template).filter(models.Template.id == template_id).first()
+async def get_template(template_id: int, db: AsyncSession = Depends(get_async_db)):
+    template = await db.get(models.Template, template_id)
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
     return template
@@ -48,43 +42,61 @@ def get_template(template_id: int, db: Session = Depends(get_db)):
 
 # 🚀 Update template
 @router.put("/{template_id}", response_model=schemas.TemplateResponse)
-def update_template(template_id: int, template: schemas.TemplateUpdate, db: Session = Depends(get_db)):
-    db_template = db.query(models.Template).filter(models.Template.id == template_id).first()
-    if not db_template:
+async def update_template(template_id: int, template: schemas.TemplateUpdate, db: AsyncSession = Depends(get_async_db)):
+    data = template.model_dump(exclude_unset=True)
+    if not data:
+        # Nothing to change — an empty SET would fail to compile; return the row as-is
+        return await get_template(template_id, db)
+
+    # ✅ One UPDATE ... RETURNING instead of SELECT → UPDATE → refresh
+    result = await db.execute(
+        update(models.Template)
+        .where(models.Template.id == template_id)
+        .values(**data)
+        .returning(*models.Template.__table__.c)
+    )
+    row = result.mappings().one_or_none()
+    if not row:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Template not found")
 
-    for key, value in template.dict(exclude_unset=True).items():
-        setattr(db_template, key, value)
-
-    db.commit()
-    db.refresh(db_template)
-    return db_template
+    await db.commit()
+    # Old title isn't known without a read; templates are few, drop them all
+    invalidate_template_cache()
+    return dict(row)
 
 
 # 🚀 Delete single template
 @router.delete("/{template_id}", response_model=dict)
-def delete_template(template_id: int, db: Session = Depends(get_db)):
-    db_template = db.query(models.Template).filter(models.Template.id == template_id).first()
+async def delete_template(template_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_template = await db.get(models.Template, template_id)
     if not db_template:
         raise HTTPException(status_code=404, detail="Template not found")
 
-    db.delete(db_template)
-    db.commit()
+    await db.delete(db_template)
+    await db.commit()
+    invalidate_template_cache(db_template.title)
     return {"message": f"Template {template_id} deleted successfully"}
 
 
 # 🚀 Bulk delete templates
 @router.delete("/", response_model=dict)
-def delete_templates(
+async def delete_templates(
     template_ids: List[int] = Query(..., description="IDs of templates to delete"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    templates_to_delete = db.query(models.Template).filter(models.Template.id.in_(template_ids)).all()
-    if not templates_to_delete:
+    # ✅ One DELETE ... RETURNING instead of loading and deleting row by row
+    result = await db.execute(
+        delete(models.Template)
+        .where(models.Template.id.in_(template_ids))
+        .returning(models.Template.id)
+    )
+    deleted = result.scalars().all()
+    if not deleted:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="No templates found to delete")
 
-    for template in templates_to_delete:
-        db.delete(template)
-    db.commit()
+    await db.commit()
+    invalidate_template_cache()
 
-    return {"message": f"Deleted {len(templates_to_delete)} templates successfully"}
+    return {"message": f"Deleted {len(deleted)} templates successfully"}
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional, List
 from datetime import datetime, date
 from enum import Enum
@@ -69,8 +69,7 @@ class ClientResponse(BaseModel):
     speed_limit: Optional[str] = None
     amt_monthly: Optional[float] = None  # ✅ new column
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ===============================
@@ -92,8 +91,7 @@ class TemplateUpdate(TemplateBase):
 class TemplateResponse(TemplateBase):
     id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ===============================
@@ -105,10 +103,9 @@ class MessageLogResponse(BaseModel):
   message: str
   status: str
   created_at: datetime
-  sent_at: Optional[datetime]
+  sent_at: Optional[datetime] = None
 
-  class Config:
-    orm_mode = True
+  model_config = ConfigDict(from_attributes=True)
 
 class SendRequest(BaseModel):
   title: str
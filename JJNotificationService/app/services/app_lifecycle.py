@@ -1,24 +1,25 @@
 import os
-import json
 import logging
 import threading
-from datetime import datetime
-import pytz
-from apscheduler.schedulers.background import BackgroundScheduler
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from functools import lru_cache
+from types import MappingProxyType
+import orjson
 from dotenv import load_dotenv
 from app.services.netwatch_service import start_polling, ROUTER_MAP
 from app.websocket_manager import manager
 from app.services.billing_service import BillingService
 from app.utils.mikrotik_config import MikroTikClient
+from app.services.scheduler import SCHEDULER, MANILA_TZ, configure_workers, ensure_started
 
 logger = logging.getLogger("app_lifecycle")
 
 # ✅ Load .env (important for Docker/local)
 load_dotenv()
 
-# ✅ Define Manila timezone globally
-MANILA_TZ = pytz.timezone("Asia/Manila")
-
 # ✅ Load scheduler times from .env
 NOTIFICATION_TIME = os.getenv("NOTIFICATION_TIME", "10:30")
 ENFORCEMENT_TIME = os.getenv("ENFORCEMENT_TIME", "11:00")
@@ -28,11 +29,11 @@ ENFORCE_HOUR, ENFORCE_MINUTE = map(int, ENFORCEMENT_TIME.split(":"))
 
 # ✅ Global in-memory record for daily events
 _last_state = {"notification": {}, "enforcement": {}}
-_last_lock = threading.Lock()
+_last_lock = threading.Lock()  # guards the dirty flag / disk flush only
+_claims: dict = {}  # (section, group, date) → owner token of an in-flight run
 STATE_FILE = "lifecycle_state.json"
-
-# ✅ Shared global scheduler (prevents duplicates)
-SCHEDULER = BackgroundScheduler(timezone=MANILA_TZ)
+SAVE_DEBOUNCE = 5  # seconds; coalesce bursts of state changes into one write
+_dirty = False
 
 # ------------------------------------------------------------------
 # 🔹 Safe JSON Loader
@@ -42,9 +43,9 @@ def _safe_load_json(path):
     if not os.path.exists(path) or os.path.getsize(path) == 0:
         return {}
     try:
-        with open(path, "r") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except orjson.JSONDecodeError:
         logger.warning(f"⚠️ Invalid or empty JSON in {path}, resetting lifecycle state.")
         return {}
     except Exception as e:
@@ -71,40 +72,68 @@ def _load_state():
         logger.warning(f"⚠️ Failed to load lifecycle state: {e}")
 
 def _save_state():
-    """Save in-memory lifecycle state to disk."""
+    """Mark state dirty and schedule a deferred write (re-arms the timer)."""
+    global _dirty
+    _dirty = True
+    SCHEDULER.add_job(
+        flush_state,
+        "date",
+        run_date=datetime.now(MANILA_TZ) + timedelta(seconds=SAVE_DEBOUNCE),
+        id="save_state",
+        replace_existing=True,
+        misfire_grace_time=60,
+    )
+
+def flush_state():
+    """Write in-memory lifecycle state to disk (atomic rename) if it changed."""
+    global _dirty
+    with _last_lock:
+        if not _dirty:
+            return
+        _dirty = False
+        # dict() copies are atomic under the GIL; writers never take this lock
+        data = orjson.dumps({
+            "notification": {k: v.strftime("%Y-%m-%d") for k, v in dict(_last_state["notification"]).items()},
+            "enforcement": {k: v.strftime("%Y-%m-%d") for k, v in dict(_last_state["enforcement"]).items()},
+        })
     try:
-        with open(STATE_FILE, "w") as f:
-            json.dump(
-                {
-                    "notification": {k: v.strftime("%Y-%m-%d") for k, v in _last_state["notification"].items()},
-                    "enforcement": {k: v.strftime("%Y-%m-%d") for k, v in _last_state["enforcement"].items()},
-                },
-                f,
-            )
+        tmp = STATE_FILE + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, STATE_FILE)
         logger.debug("💾 Lifecycle state saved.")
     except Exception as e:
+        _dirty = True
         logger.warning(f"⚠️ Failed to save lifecycle state: {e}")
 
+# ------------------------------------------------------------------
+# 🔹 Lock-free daily run claims
+# ------------------------------------------------------------------
+def _try_claim_today(section, group, today) -> bool:
+    """Atomically claim today's run: dict.setdefault is a single GIL-held op."""
+    token = object()
+    return _claims.setdefault((section, group, today), token) is token
+
+def _release_claim(section, group, today):
+    _claims.pop((section, group, today), None)
+
 # ------------------------------------------------------------------
 # 🔹 AppLifecycle Class
 # ------------------------------------------------------------------
 class AppLifecycle:
     """Handles a single MikroTik’s background lifecycle (polling + billing)."""
 
-    def __init__(self, host: str, user: str, password: str, poll_interval: int, group_name: str):
+    def __init__(self, host: str, user: str, password: str, poll_interval: int, group_name: str, scheduler=SCHEDULER):
         self.host = host
         self.user = user
         self.password = password
         self.poll_interval = poll_interval
         self.group_name = group_name
-        self.scheduler = SCHEDULER  # ✅ shared scheduler
+        self.scheduler = scheduler  # ✅ shared scheduler (started once by start_all_lifecycles)
 
         # ✅ FIX: include group_name in BillingService
         self.billing_service = BillingService(host, user, password, group_name)
 
-        # ✅ runtime guards
-        self._notification_running = False
-        self._enforcement_running = False
 
     # ------------------------------------------------------------------
     # 🔹 Initial Poll
@@ -129,7 +158,7 @@ class AppLifecycle:
         logger.info(
           f"🛰️ [{self.group_name}] start_polling invoked with router_map={router_map}")
 
-        # ✅ Start actual polling threads directly (mikrotik_poll handles threading internally)
+        # ✅ Attach this router to the shared netwatch poll loop (one coroutine per router)
         start_polling(
           username=self.user,
           password=self.password,
@@ -139,7 +168,7 @@ class AppLifecycle:
         )
 
         logger.info(
-          f"✅ [{self.group_name}] Netwatch polling started via mikrotik_poll.start_polling()")
+          f"✅ [{self.group_name}] Netwatch polling started via netwatch_service.start_polling()")
 
       except Exception as e:
         logger.error(f"❌ [{self.group_name}] Polling startup error: {e}")
@@ -150,49 +179,38 @@ class AppLifecycle:
     def start_scheduler(self):
         """Start billing and maintenance schedulers (with persistent catch-up)."""
         _load_state()
-        today = datetime.now(MANILA_TZ).date()
         now = datetime.now(MANILA_TZ)
-
-        with _last_lock:
-            notif_last = _last_state["notification"].get(self.group_name)
-            enforce_last = _last_state["enforcement"].get(self.group_name)
-
-            notif_time = now.replace(hour=NOTIF_HOUR, minute=NOTIF_MINUTE, second=0, microsecond=0)
-            enforce_time = now.replace(hour=ENFORCE_HOUR, minute=ENFORCE_MINUTE, second=0, microsecond=0)
-
-            # 🕒 Notification catch-up (safe)
-            if not notif_last or notif_last < today:
-                elapsed = (now - notif_time).total_seconds()
-                if now > notif_time and 3600 < elapsed < 7200:  # within 1h–2h window
-                    logger.info(f"⏰ [{self.group_name}] Missed notification — triggering catch-up.")
-                    self._run_notification(today)
-                else:
-                    logger.info(f"🕐 [{self.group_name}] Skipping notification catch-up (too close/too late).")
-
-            # ⚙️ Enforcement catch-up (safe)
-            if not enforce_last or enforce_last < today:
-                elapsed = (now - enforce_time).total_seconds()
-                if now > enforce_time and 3600 < elapsed < 7200:
-                    logger.info(f"⏰ [{self.group_name}] Missed enforcement — triggering catch-up.")
-                    self._run_enforcement(today)
-                else:
-                    logger.info(f"🕐 [{self.group_name}] Skipping enforcement catch-up (too close/too late).")
-
-        # 🔄 Regular sync every 10s (per group)
-        job_id_sync = f"sync_{self.group_name}"
-        if not self.scheduler.get_job(job_id_sync):
-            self.scheduler.add_job(
-                lambda: self.billing_service.run("sync"),
-                "interval",
-                seconds=10,
-                id=job_id_sync,
-            )
+        today = now.date()
+
+        notif_last = _last_state["notification"].get(self.group_name)
+        enforce_last = _last_state["enforcement"].get(self.group_name)
+
+        notif_time = now.replace(hour=NOTIF_HOUR, minute=NOTIF_MINUTE, second=0, microsecond=0)
+        enforce_time = now.replace(hour=ENFORCE_HOUR, minute=ENFORCE_MINUTE, second=0, microsecond=0)
+
+        # 🕒 Notification catch-up (safe)
+        if not notif_last or notif_last < today:
+            elapsed = (now - notif_time).total_seconds()
+            if now > notif_time and 3600 < elapsed < 7200:  # within 1h–2h window
+                logger.info(f"⏰ [{self.group_name}] Missed notification — scheduling catch-up.")
+                self._schedule_catch_up("notification", self._run_notification, today)
+            else:
+                logger.info(f"🕐 [{self.group_name}] Skipping notification catch-up (too close/too late).")
+
+        # ⚙️ Enforcement catch-up (safe)
+        if not enforce_last or enforce_last < today:
+            elapsed = (now - enforce_time).total_seconds()
+            if now > enforce_time and 3600 < elapsed < 7200:
+                logger.info(f"⏰ [{self.group_name}] Missed enforcement — scheduling catch-up.")
+                self._schedule_catch_up("enforcement", self._run_enforcement, today)
+            else:
+                logger.info(f"🕐 [{self.group_name}] Skipping enforcement catch-up (too close/too late).")
 
         # 🕗 Daily notification (per group)
         job_id_notif = f"notification_{self.group_name}"
         if not self.scheduler.get_job(job_id_notif):
             self.scheduler.add_job(
-                lambda: self._run_notification(datetime.now(MANILA_TZ).date()),
+                self._run_notification_today,
                 "cron",
                 hour=NOTIF_HOUR,
                 minute=NOTIF_MINUTE,
@@ -205,7 +223,7 @@ class AppLifecycle:
         job_id_enforce = f"enforce_{self.group_name}"
         if not self.scheduler.get_job(job_id_enforce):
             self.scheduler.add_job(
-                lambda: self._run_enforcement(datetime.now(MANILA_TZ).date()),
+                self._run_enforcement_today,
                 "cron",
                 hour=ENFORCE_HOUR,
                 minute=ENFORCE_MINUTE,
@@ -214,78 +232,101 @@ class AppLifecycle:
                 timezone=MANILA_TZ,
             )
 
-        if not self.scheduler.running:
-            self.scheduler.start()
-            logger.info("✅ Global scheduler started (shared for all groups)")
-        else:
-            logger.info(f"🔁 Scheduler already running — attached jobs for {self.group_name}")
+        logger.info(f"🔁 Attached scheduler jobs for {self.group_name}")
 
     # ------------------------------------------------------------------
     # 🔹 Execution Wrappers (group isolated)
     # ------------------------------------------------------------------
+    def _schedule_catch_up(self, section: str, func, today):
+        """Run a catch-up on the scheduler's executor so startup isn't blocked by billing."""
+        self.scheduler.add_job(
+            func,
+            "date",
+            run_date=datetime.now(MANILA_TZ) + timedelta(seconds=1),
+            args=[today],
+            id=f"catchup_{section}_{self.group_name}",
+            replace_existing=True,
+            misfire_grace_time=300,  # scheduler starts after all lifecycles attach
+        )
+
+    def _run_notification_today(self):
+        self._run_notification(datetime.now(MANILA_TZ).date())
+
+    def _run_enforcement_today(self):
+        self._run_enforcement(datetime.now(MANILA_TZ).date())
+
+    def _admit(self, section: str, today, label: str) -> bool:
+        """Claim today's run for this group without a mutex; the billing run happens after."""
+        if _last_state[section].get(self.group_name) == today:
+            logger.info(f"🕐 [{self.group_name}] {label} already done today — skip.")
+            return False
+        if not _try_claim_today(section, self.group_name, today):
+            logger.info(f"🛑 [{self.group_name}] {label} already running — skip duplicate.")
+            return False
+        # Re-check: a run may have finished (and released) between the two steps
+        if _last_state[section].get(self.group_name) == today:
+            _release_claim(section, self.group_name, today)
+            return False
+        return True
+
+    def _mark_done(self, section: str, today):
+        _last_state[section][self.group_name] = today  # single-key write, atomic under the GIL
+        _save_state()
+
     def _run_notification(self, today):
-        with _last_lock:
-            last_sent = _last_state["notification"].get(self.group_name)
-            if last_sent == today:
-                logger.info(f"🕐 [{self.group_name}] Notification already sent today — skip.")
-                return
-            if self._notification_running:
-                logger.info(f"🛑 [{self.group_name}] Notification already running — skip duplicate.")
-                return
-
-            self._notification_running = True
-            try:
-                self.billing_service.run("notification")
-                _last_state["notification"][self.group_name] = today
-                _save_state()
-                logger.info(f"📩 [{self.group_name}] Notification executed successfully.")
-            except Exception as e:
-                logger.error(f"❌ [{self.group_name}] Notification failed: {e}")
-            finally:
-                self._notification_running = False
+        if not self._admit("notification", today, "Notification"):
+            return
+        try:
+            self.billing_service.run("notification")
+            self._mark_done("notification", today)
+            logger.info(f"📩 [{self.group_name}] Notification executed successfully.")
+        except Exception as e:
+            logger.error(f"❌ [{self.group_name}] Notification failed: {e}")
+        finally:
+            _release_claim("notification", self.group_name, today)
 
     def _run_enforcement(self, today):
-        with _last_lock:
-            last_sent = _last_state["enforcement"].get(self.group_name)
-            if last_sent == today:
-                logger.info(f"🕐 [{self.group_name}] Enforcement already done today — skip.")
-                return
-            if self._enforcement_running:
-                logger.info(f"🛑 [{self.group_name}] Enforcement already running — skip duplicate.")
-                return
-
-            self._enforcement_running = True
-            try:
-                self.billing_service.run("enforce")
-                _last_state["enforcement"][self.group_name] = today
-                _save_state()
-                logger.info(f"⚙️ [{self.group_name}] Enforcement executed successfully.")
-            except Exception as e:
-                logger.error(f"❌ [{self.group_name}] Enforcement failed: {e}")
-            finally:
-                self._enforcement_running = False
+        if not self._admit("enforcement", today, "Enforcement"):
+            return
+        try:
+            self.billing_service.run("enforce")
+            self._mark_done("enforcement", today)
+            logger.info(f"⚙️ [{self.group_name}] Enforcement executed successfully.")
+        except Exception as e:
+            logger.error(f"❌ [{self.group_name}] Enforcement failed: {e}")
+        finally:
+            _release_claim("enforcement", self.group_name, today)
 
     # ------------------------------------------------------------------
     # 🔹 Lifecycle Start & Stop
     # ------------------------------------------------------------------
-    def startup(self):
+    def start(self):
+        """
+        Start polling and the daily jobs. Expects initial_poll() to have run —
+        start_all_lifecycles does that for every router in parallel first.
+        """
         logger.info(f"🚀 Starting lifecycle for {self.group_name}")
-        self.initial_poll()
         self.start_polling()
         self.start_scheduler()
+        logger.info(f"✅ Started lifecycle for MikroTik group '{self.group_name}'")
 
     def shutdown(self):
+        """Drop this group's jobs; the shared scheduler is stopped once by shutdown_scheduler()."""
+        flush_state()  # don't lose a debounced write
         try:
-            logger.info(f"🛑 [{self.group_name}] Shutting down scheduler...")
-            if self.scheduler.running:
-                self.scheduler.shutdown()
+            logger.info(f"🛑 [{self.group_name}] Removing scheduled jobs...")
+            for job_id in (f"notification_{self.group_name}", f"enforce_{self.group_name}"):
+                if self.scheduler.get_job(job_id):
+                    self.scheduler.remove_job(job_id)
         except Exception as e:
             logger.error(f"❌ [{self.group_name}] Error during shutdown: {e}")
 
 # ------------------------------------------------------------------
 # 🔸 Load All MikroTik Routers from ROUTER_MAP
 # ------------------------------------------------------------------
-def load_all_mikrotiks():
+@lru_cache(maxsize=1)
+def load_all_mikrotiks() -> tuple:
+    """Parse ROUTER_MAP + env once; entries are read-only (call cache_clear() to reload)."""
     mikrotiks = []
     username = os.getenv("MIKROTIK_USER", "admin")
     password = os.getenv("MIKROTIK_PASS", "")
@@ -298,16 +339,90 @@ def load_all_mikrotiks():
             continue
         seen_groups.add(group_name)
 
-        mikrotiks.append({
+        mikrotiks.append(MappingProxyType({
             "host": host,
             "user": username,
             "password": password,
             "poll_interval": poll_interval,
             "group_name": group_name,
-        })
+        }))
 
     logger.info(f"✅ Loaded {len(mikrotiks)} routers from ROUTER_MAP")
-    return mikrotiks
+    return tuple(mikrotiks)
+
+# ------------------------------------------------------------------
+# 🔸 Batched Billing Sync (one loop for all routers)
+# ------------------------------------------------------------------
+SYNC_INTERVAL = 10  # seconds between sweeps
+_sync_stop = threading.Event()
+_sync_thread = None
+
+def _sync_sweep(lifecycles):
+    """Sync every group whose clients changed, sharing one DB session."""
+    pending = {}
+    routers = []
+    with ExitStack() as held:
+        for lc in lifecycles:
+            service = lc.billing_service
+            marker = service.pending_sync()
+            if marker is None:
+                continue
+            # Sync never calls the router API — reuse the pooled (lazy) clients
+            # instead of constructing fresh MikroTikClients every tick; a group
+            # busy with a scheduled run stays pending for the next tick
+            group_routers = held.enter_context(service.borrow_routers(blocking=False))
+            if group_routers is None:
+                continue
+            pending[lc.group_name] = (service, marker)
+            routers.extend(group_routers)
+        if not pending:
+            return
+        for group in BillingService.run_batch(list(pending), "sync", routers=routers):
+            service, marker = pending[group]
+            service.mark_synced(marker)
+
+def _recycle_connections(lifecycles):
+    for lc in lifecycles:
+        lc.billing_service.recycle()
+
+def _sync_loop(lifecycles):
+    """Absolute monotonic deadlines: no drift, one wakeup per tick, overruns coalesce."""
+    next_t = time.monotonic()
+    while True:
+        next_t += SYNC_INTERVAL
+        if _sync_stop.wait(max(0.0, next_t - time.monotonic())):
+            return
+        try:
+            _sync_sweep(lifecycles)
+        except Exception as e:
+            logger.error(f"❌ Billing sync sweep failed: {e}")
+        now = time.monotonic()
+        if now > next_t + SYNC_INTERVAL:
+            next_t = now  # skip missed ticks instead of bursting to catch up
+
+def _start_sync_loop(lifecycles):
+    global _sync_thread
+    if _sync_thread and _sync_thread.is_alive():
+        return
+    _sync_stop.clear()
+    _sync_thread = threading.Thread(target=_sync_loop, args=(lifecycles,), daemon=True, name="billing-sync")
+    _sync_thread.start()
+
+def stop_sync_loop():
+    _sync_stop.set()
+
+def _schedule_maintenance(lifecycles):
+    # 🔌 Daily refresh of pooled RouterOS connections (avoid stale sockets)
+    SCHEDULER.add_job(
+        _recycle_connections,
+        "cron",
+        hour=3,
+        minute=0,
+        args=[lifecycles],
+        id="mikrotik_recycle",
+        replace_existing=True,
+        timezone=MANILA_TZ,
+    )
 
 # ------------------------------------------------------------------
 # 🔸 Start All Lifecycles (Called by main.py)
@@ -318,12 +433,23 @@ def start_all_lifecycles():
         logger.warning("⚠️ No MikroTik routers found in ROUTER_MAP.")
         return []
 
-    lifecycles = []
-    for cfg in mikrotiks:
-        lifecycle = AppLifecycle(**cfg)
-        lifecycle.startup()
-        lifecycles.append(lifecycle)
-        logger.info(f"✅ Started lifecycle for MikroTik group '{cfg['group_name']}'")
+    configure_workers(len(mikrotiks))
+
+    lifecycles = [AppLifecycle(**cfg, scheduler=SCHEDULER) for cfg in mikrotiks]
+
+    # ⚡ Initial polls are independent blocking logins — run them side by side
+    with ThreadPoolExecutor(max_workers=len(lifecycles), thread_name_prefix="initial-poll") as pool:
+        list(pool.map(AppLifecycle.initial_poll, lifecycles))
+
+    for lifecycle in lifecycles:
+        lifecycle.start()
+
+    # 🔄 Regular sync every 10s — one sweep for all groups, skipped when nothing changed
+    _start_sync_loop(lifecycles)
+    _schedule_maintenance(lifecycles)
+
+    # ✅ One timer thread + one job pool for every router
+    ensure_started()
 
     logger.info(f"🌍 Total MikroTik routers active: {len(lifecycles)}")
     return lifecycles
@@ -1,8 +1,22 @@
 import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
 from sqlalchemy.orm import Session
-from app.database import SessionLocal
+from app.database import ScopedSession
+from app.services import clients_cache
+from app.services.client_service import get_clients_by_groups
+from app.services.scheduler import MANILA_TZ
 from app.utils.mikrotik_config import MikroTikClient
-from app.utils.billing import check_billing
+from functools import partial
+from app.utils.billing import (
+    billing_scope,
+    check_billing,
+    check_billing_enforce,
+    check_billing_notify,
+    check_billing_sync,
+    load_all_mikrotiks,
+)
 
 logger = logging.getLogger("billing_service")
 
@@ -17,6 +31,71 @@ class BillingService:
         self.user = user
         self.password = password
         self.group_name = group_name  # ✅ identify router group this service belongs to
+        self._synced = None  # (clients version, date) seen by the last sync
+        self._mt = None      # long-lived MikroTik client (connects lazily on first API call)
+        # routeros_api sockets aren't thread-safe: one user of _mt at a time
+        # (scheduled runs, the sync sweep, /billing/run and recycle)
+        self._mt_lock = threading.RLock()
+
+        # ✅ Mode → handler resolved once; run() is a dict lookup
+        self._handlers = {
+            "sync": partial(check_billing_sync, group_name=group_name),
+            "enforce": partial(check_billing_enforce, group_name=group_name),
+            "notification": partial(check_billing_notify, group_name=group_name),
+        }
+
+    def _client(self) -> MikroTikClient:
+        with self._mt_lock:
+            if self._mt is None:
+                self._mt = MikroTikClient(self.host, self.user, self.password)
+            return self._mt
+
+    def _routers(self) -> list[dict]:
+        return [{"group": self.group_name.upper(), "client": self._client()}]
+
+    @contextmanager
+    def borrow_routers(self, blocking: bool = True):
+        """
+        Yield this group's routers with exclusive use of the pooled client
+        for the whole block. With blocking=False yields None if it's busy.
+        """
+        if not self._mt_lock.acquire(blocking):
+            yield None
+            return
+        try:
+            yield self._routers()
+        finally:
+            self._mt_lock.release()
+
+    def recycle(self):
+        """Drop the pooled RouterOS connection; waits for any run using it to finish."""
+        with self._mt_lock:
+            mt, self._mt = self._mt, None
+        try:
+            if mt and getattr(mt, "api_pool", None):
+                mt.api_pool.disconnect()
+                logger.debug(f"🔌 [{self.group_name}] MikroTik connection recycled.")
+        except Exception as e:
+            logger.debug(f"⚠️ [{self.group_name}] Error closing MikroTik connection: {e}")
+
+    def _sync_marker(self):
+        return clients_cache.current_version(), datetime.now(MANILA_TZ).date()
+
+    def has_pending_changes(self) -> bool:
+        """True if client rows changed (version bump) or the day rolled over since the last sync."""
+        return self._synced != self._sync_marker()
+
+    def pending_sync(self):
+        """
+        For batched sync sweeps: the marker when this group needs a sync, else None.
+        Borrow the routers with borrow_routers() for the batch and hand the
+        marker back to mark_synced() once it commits.
+        """
+        marker = self._sync_marker()
+        return None if self._synced == marker else marker
+
+    def mark_synced(self, marker):
+        self._synced = marker
 
     def run(self, mode: str = "enforce"):
         """
@@ -26,17 +105,23 @@ class BillingService:
           - 'enforce': Apply restrictions (cutoff/limit)
           - 'sync': Periodic background synchronization
         """
-        valid_modes = {"notification", "enforce", "sync"}
-        if mode not in valid_modes:
-            logger.error(f"⚠️ Invalid mode '{mode}' — must be one of {valid_modes}")
+        handler = self._handlers.get(mode)
+        if handler is None:
+            logger.error(f"⚠️ Invalid mode '{mode}' — must be one of {set(self._handlers)}")
             return
 
-        db: Session = SessionLocal()
-        mikrotik = MikroTikClient(self.host, self.user, self.password)
+        if mode == "sync":
+            marker = self._sync_marker()
+
+        db: Session = ScopedSession()
 
         try:
-            # ✅ Limit to this group only
-            check_billing(db, mode=mode, group_name=self.group_name)
+            # ✅ Limit to this group only; reuse the pooled router connection,
+            # held exclusively for the whole handler call
+            with self.borrow_routers() as routers:
+                handler(db, routers=routers)
+            if mode == "sync":
+                self._synced = marker
             logger.info(f"✅ [{self.group_name}] Billing '{mode}' executed successfully.")
 
         except Exception as e:
@@ -46,11 +131,40 @@ class BillingService:
             )
 
         finally:
-            # ✅ Always close DB and MikroTik connections
-            db.close()
-            try:
-                if mikrotik and getattr(mikrotik, "api_pool", None):
-                    mikrotik.api_pool.disconnect()
-                    logger.debug(f"🔌 [{self.group_name}] MikroTik connection closed.")
-            except Exception as e:
-                logger.debug(f"⚠️ [{self.group_name}] Error closing MikroTik connection: {e}")
+            # ✅ Always release the thread's session; the MikroTik client stays pooled
+            ScopedSession.remove()
+
+    @staticmethod
+    def run_batch(groups: list[str], mode: str = "sync", routers: list[dict] | None = None) -> list[str]:
+        """
+        Run one billing mode for several groups on a single DB session.
+        Returns the groups that completed; a failing group doesn't stop the rest.
+        Pass routers (e.g. from existing services) to avoid building new clients.
+        """
+        done = []
+        if routers is None:
+            routers = load_all_mikrotiks()
+        db: Session = ScopedSession()
+        try:
+            # ✅ One query for every group's billable clients
+            by_group = get_clients_by_groups(db, groups, billing_scope())
+            for group in groups:
+                try:
+                    # Savepoint per group: a failure rolls back only that group,
+                    # and no mid-batch commit expires the prefetched rows
+                    with db.begin_nested():
+                        check_billing(
+                            db, mode=mode, group_name=group, routers=routers,
+                            clients=by_group.get(group, []), commit=False,
+                        )
+                    done.append(group)
+                except Exception as e:
+                    logger.error(f"❌ [{group}] Billing job failed during '{mode}': {e}", exc_info=True)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            ScopedSession.remove()
+        logger.debug(f"✅ Batched billing '{mode}' finished for {done}")
+        return done
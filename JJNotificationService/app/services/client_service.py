@@ -1,20 +1,42 @@
 import logging
-from typing import Dict, List, Optional
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional
 
-from sqlalchemy import any_
+from sqlalchemy import any_, select, update
 from sqlalchemy.orm import Session
 
 from app.models import Client, ClientStateHistory, ConnectionState
 from app.services.websocket_service import broadcast_state_change
+from app.services import clients_cache
 
 logger = logging.getLogger("client_service_sync")
 
+
+class StateChange(NamedTuple):
+    """Plain snapshot of a changed client — safe to read after commit (no lazy loads)."""
+    id: int
+    messenger_id: Optional[str]
+    name: str
+    connection_name: str
+    group_name: Optional[str]
+    status: object
+    state: ConnectionState
+
 # ============================================================
 # Queries (sync)
 # ============================================================
 def get_clients(db: Session, group_name: str) -> List[Client]:
     return db.query(Client).filter(Client.group_name == group_name).all()
 
+def get_clients_by_groups(db: Session, groups: List[str], *criteria) -> Dict[str, List[Client]]:
+    """One `group_name = ANY(:groups)` query, bucketed by group (extra filters via criteria)."""
+    by_group: Dict[str, List[Client]] = defaultdict(list)
+    if not groups:
+        return by_group
+    for client in db.query(Client).filter(Client.group_name == any_(list(groups)), *criteria):
+        by_group[client.group_name].append(client)
+    return by_group
+
 def get_clients_by_state(db: Session, group_name: str, state: ConnectionState) -> List[Client]:
     return (
         db.query(Client)
@@ -33,9 +55,10 @@ def get_clients_by_state(db: Session, group_name: str, state: ConnectionState) -
 def update_client_status(
     db: Session,
     group: str,
-    rule_states: Dict[str, ConnectionState],
+    rule_states_lc: Dict[str, ConnectionState],
     ws_manager=None,
-) -> List[Client]:
+) -> List[StateChange]:
+    """rule_states_lc: netwatch rule states keyed by lowercased connection name."""
     if not group:
         raise ValueError("group is required")
 
@@ -44,43 +67,54 @@ def update_client_status(
         logger.info("[%s] No clients found", group)
         return []
 
-    normalized_rules = {k.lower(): v for k, v in rule_states.items() if k}
-    changed_clients: List[Client] = []
+    changed: List[StateChange] = []
+    mappings: List[dict] = []
+    history: List[dict] = []
 
     for client in clients:
         if not client.connection_name:
             continue
 
         prev_state = client.state
-        client_key = client.connection_name.lower()
-        new_state = normalized_rules.get(client_key, ConnectionState.UNKNOWN)
+        client_key = client.connection_name_lc or client.connection_name.lower()
+        new_state = rule_states_lc.get(client_key, ConnectionState.UNKNOWN)
 
         if prev_state == new_state:
             continue
 
-        # Update client
-        client.state = new_state
-        db.add(client)
-
-        # Persist history
-        db.add(ClientStateHistory(client_id=client.id, prev_state=prev_state, new_state=new_state, reason="netwatch"))
+        # Queue the change — no ORM mutation / unit-of-work in the hot loop
+        mappings.append({"id": client.id, "state": new_state})
+        history.append({"client_id": client.id, "prev_state": prev_state, "new_state": new_state, "reason": "netwatch"})
+        changed.append(StateChange(
+            client.id, client.messenger_id, client.name, client.connection_name,
+            client.group_name, client.status, new_state,
+        ))
 
         logger.info("[%s] %s (%s): %s → %s", group, client.name, client.connection_name, prev_state, new_state)
-        changed_clients.append(client)
 
-        # WebSocket broadcast (sync)
-        if ws_manager:
-            broadcast_state_change(ws_manager, client, client.connection_name, new_state)
+    if not changed:
+        logger.debug("[%s] Clients updated: 0", group)
+        return []
 
     try:
+        # ✅ One executemany for states, one Core executemany for history
+        db.bulk_update_mappings(Client, mappings)
+        db.execute(ClientStateHistory.__table__.insert(), history)
         db.commit()
     except Exception:
         db.rollback()
         logger.exception("[%s] Failed to commit netwatch updates", group)
         raise
 
-    logger.debug("[%s] Clients updated: %d", group, len(changed_clients))
-    return changed_clients
+    clients_cache.bump_version()
+
+    # WebSocket broadcast (sync) — after commit, off the DB critical path
+    if ws_manager:
+        for change in changed:
+            broadcast_state_change(ws_manager, change, change.connection_name, change.state)
+
+    logger.debug("[%s] Clients updated: %d", group, len(changed))
+    return changed
 
 
 # ============================================================
@@ -91,41 +125,63 @@ def update_client_under_route_state(
     group: str,
     state: ConnectionState,
     ws_manager=None,
-) -> List[Client]:
+) -> list:
+    """
+    Flip every client in the group to `state` with one UPDATE ... RETURNING.
+    Returns the changed rows (id, name, messenger_id, connection_name, prev_state).
+    """
     if not group:
         raise ValueError("group is required")
 
-    clients = get_clients(db, group)
-    if not clients:
-        logger.info("[%s] No clients found for bulk update", group)
-        return []
-
-    changed_clients: List[Client] = []
     reason = "router_down" if state == ConnectionState.DOWN else "router_up"
-
-    for client in clients:
-        if client.state == state:
-            continue
-
-        prev_state = client.state
-        client.state = state
-        db.add(client)
-
-        db.add(ClientStateHistory(client_id=client.id, prev_state=prev_state, new_state=state, reason=reason))
-
-        logger.info("[%s] %s (%s) bulk: %s → %s", group, client.name, client.connection_name, prev_state, state)
-        changed_clients.append(client)
-
-        # WebSocket broadcast (sync)
-        if ws_manager:
-            broadcast_state_change(ws_manager, client, client.connection_name, state)
+    clients = Client.__table__
+
+    # Old state is captured by joining the locked pre-update rows
+    old = (
+        select(clients.c.id, clients.c.state.label("prev_state"))
+        .where(clients.c.group_name == group, clients.c.state != state)
+        .with_for_update()
+        .subquery("old")
+    )
 
     try:
+        changed = db.execute(
+            update(clients)
+            .where(clients.c.id == old.c.id)
+            .values(state=state)
+            .returning(
+                clients.c.id,
+                clients.c.name,
+                clients.c.messenger_id,
+                clients.c.connection_name,
+                old.c.prev_state,
+            )
+        ).all()
+
+        if not changed:
+            db.rollback()
+            logger.info("[%s] No clients need a bulk update to %s", group, state)
+            return []
+
+        # Core executemany — no ORM object construction / identity-map work
+        db.execute(ClientStateHistory.__table__.insert(), [
+            {"client_id": row.id, "prev_state": row.prev_state, "new_state": state, "reason": reason}
+            for row in changed
+        ])
         db.commit()
     except Exception:
         db.rollback()
         logger.exception("[%s] Failed to commit bulk updates", group)
         raise
 
-    logger.debug("[%s] Bulk clients updated: %d", group, len(changed_clients))
-    return changed_clients
+    clients_cache.bump_version()
+
+    for row in changed:
+        logger.info("[%s] %s (%s) bulk: %s → %s", group, row.name, row.connection_name, row.prev_state, state)
+
+        # WebSocket broadcast (sync)
+        if ws_manager:
+            broadcast_state_change(ws_manager, row, row.connection_name, state)
+
+    logger.debug("[%s] Bulk clients updated: %d", group, len(changed))
+    return changed
@@ -0,0 +1,53 @@
+# ============================================================
+# 🗂️ Clients list response cache
+# The dashboard polls GET /clients/ — serve the encoded list from
+# memory until a mutation bumps the version (or the TTL lapses for
+# writes made outside this process).
+# ============================================================
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+CLIENTS_CACHE_TTL = float(os.getenv("CLIENTS_CACHE_TTL", "30"))
+_MAX_VERSIONS = 2
+
+_lock = threading.Lock()
+_version = 0
+_cache: "OrderedDict[int, tuple[float, bytes]]" = OrderedDict()
+
+
+def current_version() -> int:
+    return _version
+
+
+def bump_version() -> int:
+    """Call after any committed change to the clients table."""
+    global _version
+    with _lock:
+        _version += 1
+        _cache.clear()
+        return _version
+
+
+def get(version: int) -> Optional[bytes]:
+    with _lock:
+        entry = _cache.get(version)
+        if entry is None:
+            return None
+        stored_at, body = entry
+        if time.monotonic() - stored_at > CLIENTS_CACHE_TTL:
+            del _cache[version]
+            return None
+        return body
+
+
+def put(version: int, body: bytes):
+    with _lock:
+        # A bump raced the query — this body is already stale
+        if version != _version:
+            return
+        _cache[version] = (time.monotonic(), body)
+        while len(_cache) > _MAX_VERSIONS:
+            _cache.popitem(last=False)
@@ -1,16 +1,20 @@
 import logging
 import threading
 import time
-from queue import Queue, Empty
+from collections import deque
+from functools import lru_cache
+from queue import Queue, Empty, Full
 from typing import List, Optional
 
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import SessionLocal
 from app.models import Client, ClientStateHistory
 from app.schemas import ConnectionState, BillingStatus
-from app.services.template_service import get_template
-from app.utils.messengerV2 import send_message
+from app.services import clients_cache
+from app.services.template_service import get_template, get_templates_by_titles, template_title
+from app.utils.messengerV2 import send_message_batch
 
 logger = logging.getLogger("notification_service")
 
@@ -23,28 +27,95 @@ PRIVATE_KEYWORD = "PRIVATE"
 
 OBSERVATION_WINDOW = 60
 RATE_LIMIT_PER_GROUP = 5
-WORKER_SLEEP = 0.1
+WORKER_MIN_WAIT = 0.01  # floor for the refill wait, avoids a hot spin on rounding
 ADMIN_DEDUPE_WINDOW = 60
 UP_THROTTLE_WINDOW = 30
+RECIPIENT_CACHE_TTL = 30
+CACHE_SWEEP_INTERVAL = 60
+QUEUE_CAP = 2000          # per group; oldest message is dropped beyond this
+DROP_LOG_EVERY = 100
+SLOT_POOL_MAX = 4096
 
 PLACEHOLDER_REPLACEMENTS = {
     PRIVATE_KEYWORD: "Your",
     VENDO_KEYWORD: "Vendo",
 }
 
+# ============================================================
+# Queued message slots (recycled through a free-list)
+# ============================================================
+class MsgSlot:
+    __slots__ = ("client", "content", "group")
+
+
+# deque append/pop are atomic, so producers and the worker share it without a lock
+_slot_pool: deque = deque(maxlen=SLOT_POOL_MAX)
+
+
+def _acquire_slot(client, content: str, group: str) -> MsgSlot:
+    try:
+        slot = _slot_pool.pop()
+    except IndexError:
+        slot = MsgSlot()
+    slot.client = client
+    slot.content = content
+    slot.group = group
+    return slot
+
+
+def _release_slot(slot: MsgSlot) -> None:
+    slot.client = slot.content = slot.group = None
+    _slot_pool.append(slot)
+
 # ============================================================
 # Thread-safe runtime state
 # ============================================================
+class GroupBucket:
+    """Token bucket: RATE_LIMIT_PER_GROUP sends/second, bursting up to the same amount."""
+    __slots__ = ("tokens", "last_refill")
+
+    def __init__(self, now: float):
+        self.tokens = float(RATE_LIMIT_PER_GROUP)
+        self.last_refill = now
+
+
 group_queues: dict[str, Queue] = {}
-group_last_tick: dict[str, float] = {}
-group_sent_count: dict[str, int] = {}
+group_buckets: dict[str, GroupBucket] = {}
+dropped_count: dict[str, int] = {}
 
 queue_lock = threading.Lock()
-rate_lock = threading.Lock()
+
+# enqueue_message raises _new_work and notifies; the worker sleeps on it
+_wakeup = threading.Condition()
+_new_work = False
+_last_sweep = time.monotonic()
+
+# Per-group rate state is guarded by a fixed stripe of locks, so no
+# lock object is ever allocated for a newly seen group
+_LOCK_STRIPES = [threading.Lock() for _ in range(32)]
+
+
+def group_lock(group: str) -> threading.Lock:
+    return _LOCK_STRIPES[hash(group) & 31]
 
 admin_dedupe_cache: dict[tuple, float] = {}
 up_throttle_cache: dict[int, float] = {}
 
+# group → (fetched_at, clients_cache version, rows)
+_admins_cache: dict[str, tuple[float, int, list]] = {}
+_members_cache: dict[str, tuple[float, int, list]] = {}
+recipients_lock = threading.RLock()
+
+# Only what the queue worker and the ISP filter read
+_RECIPIENT_COLUMNS = (
+    Client.id,
+    Client.messenger_id,
+    Client.name,
+    Client.connection_name,
+    Client.state,
+    Client.status,
+)
+
 # ============================================================
 # Queue worker
 # ============================================================
@@ -57,51 +128,171 @@ def start_queue_worker() -> None:
 
 
 def _queue_worker_loop() -> None:
+    global _new_work, _last_sweep
     while True:
+        timeout = None
         try:
-            now = time.time()
+            if time.monotonic() - _last_sweep >= CACHE_SWEEP_INTERVAL:
+                _sweep_caches()
+                _last_sweep = time.monotonic()
+
             with queue_lock:
                 groups_snapshot = list(group_queues.items())
 
+            pending = []
             for group, queue in groups_snapshot:
-                _reset_rate_limit_if_needed(group, now)
+                if queue.empty():
+                    _prune_group(group, queue)
+                    continue
                 _process_group_queue(group, queue)
+                if not queue.empty():
+                    pending.append(group)
+
+            # Rate-limited leftovers: come back when the first bucket refills
+            if pending:
+                timeout = max(WORKER_MIN_WAIT, min(_refill_delay(g) for g in pending))
 
         except Exception:
             logger.exception("Notification worker crashed, retrying in 1s")
-            time.sleep(1)
+            timeout = 1
 
-        time.sleep(WORKER_SLEEP)
+        # Never sleep past the next cache sweep
+        until_sweep = max(WORKER_MIN_WAIT, CACHE_SWEEP_INTERVAL - (time.monotonic() - _last_sweep))
+        timeout = until_sweep if timeout is None else min(timeout, until_sweep)
 
+        with _wakeup:
+            _wakeup.wait_for(lambda: _new_work, timeout=timeout)
+            _new_work = False
 
-def _reset_rate_limit_if_needed(group: str, now: float) -> None:
-    with rate_lock:
-        last_tick = group_last_tick.get(group, 0)
-        if now - last_tick >= 1:
-            group_last_tick[group] = now
-            group_sent_count[group] = 0
 
+def _expire(cache: dict, window: float, now: float) -> int:
+    """Delete entries whose timestamp is older than window; returns how many went."""
+    removed = 0
+    for key in list(cache):
+        # Re-read: a sender may have refreshed the entry since the snapshot
+        if now - cache.get(key, now) >= window:
+            cache.pop(key, None)
+            removed += 1
+    return removed
 
-def _process_group_queue(group: str, queue: Queue) -> None:
-    while True:
-        with rate_lock:
-            if group_sent_count.get(group, 0) >= RATE_LIMIT_PER_GROUP:
-                return
 
-        try:
-            client, content = queue.get_nowait()
-        except Empty:
+def _sweep_caches() -> None:
+    """Bound the dedupe/throttle maps to recently active keys instead of every key ever seen."""
+    now = time.time()
+    removed = _expire(admin_dedupe_cache, ADMIN_DEDUPE_WINDOW, now)
+    removed += _expire(up_throttle_cache, UP_THROTTLE_WINDOW, now)
+
+    mono = time.monotonic()
+    with recipients_lock:
+        for cache in (_admins_cache, _members_cache):
+            for group in [g for g, entry in cache.items() if mono - entry[0] >= RECIPIENT_CACHE_TTL]:
+                del cache[group]
+                removed += 1
+
+    if removed:
+        logger.debug("Swept %d expired notification cache entries", removed)
+
+
+def _notify_worker() -> None:
+    global _new_work
+    with _wakeup:
+        _new_work = True
+        _wakeup.notify()
+
+
+def _refill_delay(group: str) -> float:
+    """Seconds until the group's bucket holds a whole token again."""
+    with group_lock(group):
+        bucket = group_buckets.get(group)
+        if bucket is None:
+            return 0.0
+        tokens = bucket.tokens + (time.monotonic() - bucket.last_refill) * RATE_LIMIT_PER_GROUP
+    return max(0.0, (1 - tokens) / RATE_LIMIT_PER_GROUP)
+
+
+def _prune_group(group: str, queue: Queue) -> None:
+    """Drop an idle group's buckets so the maps only hold groups with pending work."""
+    # A drained bucket must survive until it has refilled, or the next
+    # burst would start from a fresh full bucket and exceed the rate.
+    # Only this worker thread spends tokens, so it can't drain after the check.
+    if not _bucket_refilled(group):
+        return  # retried on a later pass
+
+    with queue_lock:
+        # enqueue_message puts under queue_lock, so nothing can slip in here
+        if not queue.empty() or group_queues.get(group) is not queue:
             return
+        del group_queues[group]
+        dropped_count.pop(group, None)
+    with group_lock(group):
+        group_buckets.pop(group, None)
+
+
+def _bucket_refilled(group: str) -> bool:
+    with group_lock(group):
+        bucket = group_buckets.get(group)
+        if bucket is None:
+            return True
+        elapsed = time.monotonic() - bucket.last_refill
+        return bucket.tokens + elapsed * RATE_LIMIT_PER_GROUP >= RATE_LIMIT_PER_GROUP
+
+
+def _take_token(group: str) -> bool:
+    """Refill and spend in one locked step, so a group can never exceed its rate."""
+    now = time.monotonic()
+    with group_lock(group):
+        bucket = group_buckets.get(group)
+        if bucket is None:
+            bucket = group_buckets[group] = GroupBucket(now)
+        else:
+            bucket.tokens = min(
+                RATE_LIMIT_PER_GROUP,
+                bucket.tokens + (now - bucket.last_refill) * RATE_LIMIT_PER_GROUP,
+            )
+            bucket.last_refill = now
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        return True
 
+
+def _refund_token(group: str) -> None:
+    with group_lock(group):
+        bucket = group_buckets.get(group)
+        if bucket is not None:
+            bucket.tokens = min(RATE_LIMIT_PER_GROUP, bucket.tokens + 1)
+
+
+def _process_group_queue(group: str, queue: Queue) -> None:
+    # Drain as many messages as the bucket allows, then send them in one batch
+    batch = []
+    while _take_token(group):
         try:
-            db = next(get_db())
-            send_message(db, client.messenger_id, f"From {client.connection_name}", content)
-            logger.info("[%s] Sent → %s (%s)", group, client.name, client.connection_name)
-        except Exception:
-            logger.exception("[%s] Failed to send message to %s", group, client.name)
+            slot = queue.get_nowait()
+        except Empty:
+            _refund_token(group)
+            break
+        batch.append((slot.client, slot.content))
+        _release_slot(slot)
+
+    if not batch:
+        return
 
-        with rate_lock:
-            group_sent_count[group] = group_sent_count.get(group, 0) + 1
+    try:
+        with SessionLocal() as db:
+            results = send_message_batch(
+                db,
+                [(client.messenger_id, f"From {client.connection_name}", content) for client, content in batch],
+            )
+    except Exception:
+        logger.exception("[%s] Failed to send batch of %d message(s)", group, len(batch))
+        return
+
+    for (client, _), result in zip(batch, results):
+        if result.get("message_id") or result.get("skipped"):
+            logger.info("[%s] Sent → %s (%s)", group, client.name, client.connection_name)
+        else:
+            logger.warning("[%s] Failed to send message to %s: %s", group, client.name, result.get("error", result))
 
 # ============================================================
 # Public entry
@@ -111,11 +302,16 @@ def send_notification(db: Session, clients: List[Client], is_router_down: bool,
         _notify_router_down(db, router_group)
         return
 
-    for client in clients:
-        if not client.connection_name:
-            continue
+    clients = [c for c in clients if c.connection_name]
+    if not clients:
+        return
+
+    history_by_client = fetch_recent_history(db, [c.id for c in clients])
 
-        state = evaluate_notification_state(db, client)
+    # First pass decides who gets notified; templates are then fetched in one go
+    pending = []
+    for client in clients:
+        state = evaluate_notification_state(db, client, history_by_client.get(client.id, []))
         if not state:
             continue
 
@@ -124,8 +320,15 @@ def send_notification(db: Session, clients: List[Client], is_router_down: bool,
 
         prefix = extract_prefix(client.connection_name)
         template_key = resolve_template_key(client, prefix, state)
+        pending.append((client, prefix, state, template_key, template_title(client.group_name, template_key, state)))
 
-        template = get_template(db, client.group_name, template_key, state)
+    if not pending:
+        return
+
+    templates = get_templates_by_titles(db, [title for *_, title in pending])
+
+    for client, prefix, state, template_key, title in pending:
+        template = templates.get(title)
         if not template:
             logger.warning("[%s] Missing template %s (%s)", client.group_name, template_key, state)
             continue
@@ -158,15 +361,42 @@ def _is_up_throttled(client: Client, state: ConnectionState) -> bool:
 # ============================================================
 # Notification decision logic
 # ============================================================
-def evaluate_notification_state(db: Session, client: Client) -> Optional[ConnectionState]:
-    history = (
-        db.query(ClientStateHistory)
-        .filter(ClientStateHistory.client_id == client.id)
-        .order_by(ClientStateHistory.created_at.desc())
-        .limit(2)
+def fetch_recent_history(db: Session, client_ids: List[int], depth: int = 2) -> dict[int, list]:
+    """Latest `depth` history rows per client (newest first), in one windowed query."""
+    if not client_ids:
+        return {}
+
+    rn = func.row_number().over(
+        partition_by=ClientStateHistory.client_id,
+        order_by=ClientStateHistory.created_at.desc(),
+    ).label("rn")
+    ranked = (
+        db.query(
+            ClientStateHistory.client_id,
+            ClientStateHistory.new_state,
+            ClientStateHistory.created_at,
+            rn,
+        )
+        .filter(ClientStateHistory.client_id.in_(client_ids))
+        .subquery()
+    )
+    rows = (
+        db.query(ranked.c.client_id, ranked.c.new_state, ranked.c.created_at)
+        .filter(ranked.c.rn <= depth)
+        .order_by(ranked.c.client_id, ranked.c.rn)
         .all()
     )
 
+    history_by_client: dict[int, list] = {}
+    for row in rows:
+        history_by_client.setdefault(row.client_id, []).append(row)
+    return history_by_client
+
+
+def evaluate_notification_state(db: Session, client: Client, history: Optional[list] = None) -> Optional[ConnectionState]:
+    if history is None:
+        history = fetch_recent_history(db, [client.id]).get(client.id, [])
+
     if len(history) < 2:
         return client.state if client.state != ConnectionState.UP else None
 
@@ -193,13 +423,15 @@ def resolve_template_key(client: Client, prefix: str, state: ConnectionState) ->
     return prefix
 
 
+@lru_cache(maxsize=4096)
 def extract_prefix(connection_name: str) -> str:
+    # Connection names are a small, stable set — memoized
     if not connection_name:
         return ""
     # ISP messages should preserve full connection_name for broadcast
     if connection_name.startswith(ISP_KEYWORD):
         return connection_name
-    return connection_name.split("-", 1)[0]
+    return connection_name.partition("-")[0]
 
 # ============================================================
 # Dispatching
@@ -237,9 +469,62 @@ def _apply_placeholder(prefix: str, content: str, connection_name: str) -> str:
 # Queue helpers
 # ============================================================
 def enqueue_message(client: Client, content: str, group: str) -> None:
+    slot = _acquire_slot(client, content, group)
+    dropped = 0
     with queue_lock:
-        queue = group_queues.setdefault(group, Queue())
-        queue.put((client, content))
+        queue = group_queues.get(group)
+        if queue is None:
+            queue = group_queues[group] = Queue(maxsize=QUEUE_CAP)
+        try:
+            queue.put_nowait(slot)
+        except Full:
+            # Sends are stalled — keep the newest messages, drop the oldest
+            try:
+                _release_slot(queue.get_nowait())
+            except Empty:
+                pass
+            queue.put_nowait(slot)
+            # Count per report window; the entry is cleared once reported
+            dropped = dropped_count.get(group, 0) + 1
+            if dropped >= DROP_LOG_EVERY:
+                dropped_count.pop(group, None)
+            else:
+                dropped_count[group] = dropped
+
+    _notify_worker()
+
+    if dropped == 1 or dropped >= DROP_LOG_EVERY:  # first drop, then every DROP_LOG_EVERY
+        logger.warning("[%s] Notification queue full (%d) — dropped %d oldest message(s) since last report", group, QUEUE_CAP, dropped)
+
+# ============================================================
+# Recipient lookups (cached per group)
+# ============================================================
+def _cached_recipients(cache: dict, db: Session, group: str, *criteria) -> list:
+    """Serve a group's recipient rows from memory until the TTL lapses or a client write bumps the version."""
+    version = clients_cache.current_version()
+    now = time.monotonic()
+    with recipients_lock:
+        entry = cache.get(group)
+        if entry and entry[1] == version and now - entry[0] < RECIPIENT_CACHE_TTL:
+            return entry[2]
+
+    rows = (
+        db.query(Client)
+        .with_entities(*_RECIPIENT_COLUMNS)
+        .filter(Client.group_name == group, *criteria)
+        .all()
+    )
+    with recipients_lock:
+        cache[group] = (now, version, rows)
+    return rows
+
+
+def get_admins(db: Session, group: str) -> list:
+    return _cached_recipients(_admins_cache, db, group, Client.connection_name == "ADMIN")
+
+
+def get_members(db: Session, group: str) -> list:
+    return _cached_recipients(_members_cache, db, group)
 
 # ============================================================
 # Admin notifications (deduped)
@@ -256,16 +541,14 @@ def notify_admin_deduped(db: Session, content: str, group: str, connection_name:
 
     content = content.replace(PLACEHOLDER_REPLACEMENTS.get(prefix, ""), connection_name)
 
-    admins = db.query(Client).filter(Client.group_name == group, Client.connection_name == "ADMIN").all()
-    for admin in admins:
+    for admin in get_admins(db, group):
         enqueue_message(admin, content, group)
 
 # ============================================================
 # ISP broadcast
 # ============================================================
 def notify_all_under_group(db: Session, content: str, group: str) -> None:
-    clients = db.query(Client).filter(Client.group_name == group).all()
-    for client in clients:
+    for client in get_members(db, group):
         # Skip offline clients or cut-off accounts
         if client.state == ConnectionState.DOWN or client.status == BillingStatus.CUTOFF:
             continue
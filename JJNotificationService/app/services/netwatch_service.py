@@ -1,12 +1,14 @@
-import time
+import asyncio
 import logging
 import os
+import sys
 import json
+import threading
 import traceback
 from typing import Dict, Optional
 
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import SessionLocal
 from app.models import  ConnectionState
 from app.services.client_service import (
     update_client_status,
@@ -29,6 +31,8 @@ DEFAULT_ROUTER_MAP = {
 
 group_router_status: Dict[str, ConnectionState] = {}
 
+_RULE_STATUS = {"up": ConnectionState.UP, "down": ConnectionState.DOWN}
+
 try:
     ROUTER_MAP = json.loads(os.getenv("ROUTER_MAP_JSON", "{}")) or DEFAULT_ROUTER_MAP
     logger.info("✅ Loaded router map: %s", ROUTER_MAP)
@@ -38,135 +42,138 @@ except json.JSONDecodeError:
 
 
 # ============================================================
-# Synchronous polling loop
+# One poll cycle for one router (blocking; runs in a worker thread)
 # ============================================================
-def netwatch_sync_loop(
-    username: str,
-    password: str,
-    interval: int = 30,
-    ws_manager=None,
-    router_map: Optional[Dict[str, str]] = None,
-):
-    routers = router_map or ROUTER_MAP
-
-    # Initialize MikroTik clients
-    mikrotik_clients: Dict[str, MikroTikClient] = {}
-    for group, host in routers.items():
-        try:
-            mikrotik_clients[group] = MikroTikClient(host, username, password)
-            logger.info("[%s] MikroTik initialized (%s)", group, host)
-        except Exception as e:
-            logger.error("[%s] MikroTik init failed: %s", group, e)
-
-    logger.info("🚀 Netwatch sync loop started")
+def _poll_group(group_name: str, mt_client: MikroTikClient, ws_manager=None):
+    db: Session | None = None
+    try:
+        db = SessionLocal()  # short-lived sync session, closed in finally
+
+        logger.debug("[%s] Poll cycle start", group_name)
+
+        # ====================================================
+        # Router DOWN
+        # ====================================================
+        if not mt_client.ensure_connection():
+            prev_state = group_router_status.get(group_name)
+            if prev_state != ConnectionState.DOWN:
+                logger.warning(
+                    "[%s] Router unreachable (%s) → marking clients DOWN",
+                    group_name,
+                    mt_client.host,
+                )
 
-    while True:
-        for group_name, mt_client in mikrotik_clients.items():
-            db: Session | None = None
-            try:
-                db = next(get_db())  # Use sync session
-
-                logger.debug("[%s] Poll cycle start", group_name)
-
-                # ====================================================
-                # Router DOWN
-                # ====================================================
-                if not mt_client.ensure_connection():
-                    prev_state = group_router_status.get(group_name)
-                    if prev_state != ConnectionState.DOWN:
-                        logger.warning(
-                            "[%s] Router unreachable (%s) → marking clients DOWN",
-                            group_name,
-                            mt_client.host,
-                        )
-
-                        update_client_under_route_state(
-                            db=db,
-                            group=group_name,
-                            state=ConnectionState.DOWN,
-                            ws_manager=ws_manager,
-                        )
-
-                        clients = get_clients(db, group_name)
-                        send_notification(
-                            db=db,
-                            clients=clients,
-                            is_router_down=True,
-                            router_group=group_name,
-                        )
-
-                        group_router_status[group_name] = ConnectionState.DOWN
-                    else:
-                        logger.debug("[%s] Router still DOWN", group_name)
-                    continue
-
-                # ====================================================
-                # Router RECOVERED
-                # ====================================================
-                if group_router_status.get(group_name) == ConnectionState.DOWN:
-                    logger.info("[%s] Router recovered (%s)", group_name, mt_client.host)
-
-                    update_client_under_route_state(
-                        db=db,
-                        group=group_name,
-                        state=ConnectionState.UP,
-                        ws_manager=ws_manager,
-                    )
-
-                    clients = get_clients(db, group_name)
-                    send_notification(
-                        db=db,
-                        clients=clients,
-                        is_router_down=False,
-                        router_group=group_name,
-                    )
-
-                    group_router_status[group_name] = ConnectionState.UP
-
-                # ====================================================
-                # Netwatch rule processing
-                # ====================================================
-                rules = mt_client.get_netwatch() or []
-                rule_states: Dict[str, ConnectionState] = {}
-
-                for rule in rules:
-                    name = rule.get("comment") or rule.get("host")
-                    if not name:
-                        continue
-                    name = name.replace("_", "-")
-                    raw = (rule.get("status") or "unknown").lower()
-                    state = {"up": ConnectionState.UP, "down": ConnectionState.DOWN}.get(
-                        raw, ConnectionState.UNKNOWN
-                    )
-                    rule_states[name] = state
-
-                changed_clients = update_client_status(
+                update_client_under_route_state(
                     db=db,
                     group=group_name,
-                    rule_states=rule_states,
+                    state=ConnectionState.DOWN,
                     ws_manager=ws_manager,
                 )
 
+                clients = get_clients(db, group_name)
                 send_notification(
                     db=db,
-                    clients=changed_clients,
-                    is_router_down=False,
+                    clients=clients,
+                    is_router_down=True,
                     router_group=group_name,
                 )
 
-            except Exception as e:
-                logger.error(
-                    "[%s] Netwatch error: %s\n%s",
-                    group_name,
-                    e,
-                    traceback.format_exc(),
-                )
+                group_router_status[group_name] = ConnectionState.DOWN
+            else:
+                logger.debug("[%s] Router still DOWN", group_name)
+            return
+
+        # ====================================================
+        # Router RECOVERED
+        # ====================================================
+        if group_router_status.get(group_name) == ConnectionState.DOWN:
+            logger.info("[%s] Router recovered (%s)", group_name, mt_client.host)
+
+            update_client_under_route_state(
+                db=db,
+                group=group_name,
+                state=ConnectionState.UP,
+                ws_manager=ws_manager,
+            )
+
+            clients = get_clients(db, group_name)
+            send_notification(
+                db=db,
+                clients=clients,
+                is_router_down=False,
+                router_group=group_name,
+            )
+
+            group_router_status[group_name] = ConnectionState.UP
+
+        # ====================================================
+        # Netwatch rule processing
+        # ====================================================
+        rules = mt_client.get_netwatch() or []
+        # Keys are lowercased + interned here, once per rule, for the client match
+        rule_states_lc: Dict[str, ConnectionState] = {}
+
+        for rule in rules:
+            name = rule.get("comment") or rule.get("host")
+            if not name:
+                continue
+            name = sys.intern(name.replace("_", "-").lower())
+            raw = (rule.get("status") or "unknown").lower()
+            rule_states_lc[name] = _RULE_STATUS.get(raw, ConnectionState.UNKNOWN)
+
+        changed_clients = update_client_status(
+            db=db,
+            group=group_name,
+            rule_states_lc=rule_states_lc,
+            ws_manager=ws_manager,
+        )
+
+        send_notification(
+            db=db,
+            clients=changed_clients,
+            is_router_down=False,
+            router_group=group_name,
+        )
+
+    except Exception as e:
+        logger.error(
+            "[%s] Netwatch error: %s\n%s",
+            group_name,
+            e,
+            traceback.format_exc(),
+        )
+
+    finally:
+        if db:
+            db.close()
 
-            finally:
-                if db:
-                    db.close()
 
-        time.sleep(interval)
+# ============================================================
+# Async polling: one event loop, one coroutine per router
+# ============================================================
+_poll_loop: Optional[asyncio.AbstractEventLoop] = None
+_poll_loop_lock = threading.Lock()
+
+
+def _ensure_poll_loop() -> asyncio.AbstractEventLoop:
+    global _poll_loop
+    with _poll_loop_lock:
+        if _poll_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever,
+                daemon=True,
+                name="netwatch-poll-loop",
+            ).start()
+            _poll_loop = loop
+    return _poll_loop
+
+
+async def poll_router(group_name: str, mt_client: MikroTikClient, interval: int, ws_manager=None):
+    """Poll one router forever; blocking RouterOS/DB work runs via to_thread."""
+    while True:
+        await asyncio.to_thread(_poll_group, group_name, mt_client, ws_manager)
+        await asyncio.sleep(interval)
 
 
 # ============================================================
@@ -179,15 +186,18 @@ def start_polling(
     ws_manager=None,
     router_map: Optional[Dict[str, str]] = None,
 ):
-    import threading
-    threading.Thread(
-        target=netwatch_sync_loop,
-        args=(username, password, interval, ws_manager, router_map),
-        daemon=True,
-        name="netwatch-sync-worker",
-    ).start()
-
     routers = router_map or ROUTER_MAP
+    loop = _ensure_poll_loop()
+
+    for group, host in routers.items():
+        try:
+            mt_client = MikroTikClient(host, username, password)
+            logger.info("[%s] MikroTik initialized (%s)", group, host)
+        except Exception as e:
+            logger.error("[%s] MikroTik init failed: %s", group, e)
+            continue
+        asyncio.run_coroutine_threadsafe(poll_router(group, mt_client, interval, ws_manager), loop)
+
     logger.info(
         "✅ Netwatch polling started for %d routers: %s",
         len(routers),
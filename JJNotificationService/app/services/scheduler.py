@@ -0,0 +1,42 @@
+import logging
+import threading
+from zoneinfo import ZoneInfo
+
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.schedulers.background import BackgroundScheduler
+
+logger = logging.getLogger("scheduler")
+
+# ✅ Define Manila timezone globally
+MANILA_TZ = ZoneInfo("Asia/Manila")
+
+# ✅ Shared global scheduler (prevents duplicates)
+SCHEDULER = BackgroundScheduler(timezone=MANILA_TZ)
+_start_lock = threading.Lock()
+
+
+def configure_workers(router_count: int):
+    """Size the shared job pool for the number of routers (before first start only)."""
+    workers = min(32, max(4, 4 * router_count))
+    with _start_lock:
+        if SCHEDULER.running:
+            return
+        SCHEDULER.configure(executors={"default": ThreadPoolExecutor(max_workers=workers)})
+    logger.info(f"🧵 Scheduler pool sized to {workers} workers for {router_count} routers")
+
+
+def ensure_started() -> BackgroundScheduler:
+    """Start the shared scheduler if it isn't running yet and return it."""
+    with _start_lock:
+        if not SCHEDULER.running:
+            SCHEDULER.start()
+            logger.info("✅ Global scheduler started (shared for all groups)")
+    return SCHEDULER
+
+
+def shutdown_scheduler():
+    """Stop the shared scheduler without waiting for running jobs."""
+    with _start_lock:
+        if SCHEDULER.running:
+            SCHEDULER.shutdown(wait=False)
+            logger.info("🛑 Global scheduler stopped.")
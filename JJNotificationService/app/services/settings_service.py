@@ -0,0 +1,56 @@
+# ============================================================
+# ⚙️ Runtime settings (settings.json)
+# Loaded once into memory; reads are plain dict lookups and writes
+# go through to disk with an atomic rename.
+# ============================================================
+import os
+import threading
+
+import orjson
+
+SETTINGS_FILE = "app/config/settings.json"
+
+_lock = threading.Lock()
+
+
+def _defaults() -> dict:
+    # .env value kept for backward compatibility with pre-settings.json installs
+    return {
+        "ENABLE_MESSENGER_SEND": os.getenv("ENABLE_MESSENGER_SEND", "true").lower() == "true",
+    }
+
+
+def _write(data: dict):
+    os.makedirs(os.path.dirname(SETTINGS_FILE), exist_ok=True)
+    tmp = SETTINGS_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    os.replace(tmp, SETTINGS_FILE)
+
+
+def load_settings() -> dict:
+    try:
+        with open(SETTINGS_FILE, "rb") as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        data = _defaults()
+        _write(data)
+        return data
+
+
+_SETTINGS = load_settings()
+
+
+def get_setting(key: str, default=None):
+    return _SETTINGS.get(key, default)
+
+
+def update_setting(key: str, value):
+    """Update one key in memory and persist the whole file atomically."""
+    with _lock:
+        _SETTINGS[key] = value
+        _write(_SETTINGS)
+
+
+def is_messenger_enabled() -> bool:
+    return _SETTINGS.get("ENABLE_MESSENGER_SEND", True)
@@ -1,12 +1,106 @@
 import logging
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
 
+import orjson
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 
 from app.models import Template
 
+# ============================================================
+# Template cache (titles → content); templates change rarely
+# ============================================================
+TEMPLATE_CACHE_TTL = float(os.getenv("TEMPLATE_CACHE_TTL", "30"))
+TEMPLATE_CACHE_MAX = 256
 
-def get_template(db: Session, group: str, connection_name: str, state: str) -> Template:
+
+class CachedTemplate(NamedTuple):
+    id: int
+    title: str
+    content: str
+    message_json: bytes  # pre-encoded Messenger {"text": content} object
+
+
+_cache: dict[str, tuple[float, Optional[CachedTemplate]]] = {}
+_cache_lock = threading.Lock()
+
+
+def invalidate_template_cache(title: Optional[str] = None) -> None:
+    """Drop one title (or everything) — call after template writes."""
+    with _cache_lock:
+        if title is None:
+            _cache.clear()
+        else:
+            _cache.pop(title, None)
+
+
+def get_template_by_title(db: Session, title: str) -> Optional[CachedTemplate]:
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(title)
+    if entry and now - entry[0] < TEMPLATE_CACHE_TTL:
+        return entry[1]
+
+    row = (
+        db.query(Template.id, Template.title, Template.content)
+        .filter(Template.title == title)
+        .first()
+    )
+    template = CachedTemplate(*row, orjson.dumps({"text": row.content})) if row else None
+
+    with _cache_lock:
+        if len(_cache) >= TEMPLATE_CACHE_MAX:
+            _cache.clear()
+        _cache[title] = (now, template)
+    return template
+
+
+def get_templates_by_titles(db: Session, titles) -> dict[str, Optional[CachedTemplate]]:
+    """Resolve many titles at once: cache hits from memory, all misses in one IN query."""
+    now = time.monotonic()
+    found: dict[str, Optional[CachedTemplate]] = {}
+    missing = []
+    with _cache_lock:
+        for title in set(titles):
+            entry = _cache.get(title)
+            if entry and now - entry[0] < TEMPLATE_CACHE_TTL:
+                found[title] = entry[1]
+            else:
+                missing.append(title)
+
+    if not missing:
+        return found
+
+    rows = (
+        db.query(Template.id, Template.title, Template.content)
+        .filter(Template.title.in_(missing))
+        .order_by(Template.id)
+        .all()
+    )
+    fetched: dict[str, Optional[CachedTemplate]] = dict.fromkeys(missing)
+    for row in rows:
+        # First match per title, same as get_template_by_title's .first()
+        if fetched[row.title] is None:
+            fetched[row.title] = CachedTemplate(*row, orjson.dumps({"text": row.content}))
+
+    with _cache_lock:
+        if len(_cache) + len(fetched) > TEMPLATE_CACHE_MAX:
+            _cache.clear()
+        for title, template in fetched.items():
+            _cache[title] = (now, template)
+
+    found.update(fetched)
+    return found
+
+
+def template_title(group: str, connection_name: str, state: str) -> str:
+    return f"{group}-{connection_name}-{state}"
+
+
+def get_template(db: Session, group: str, connection_name: str, state: str) -> CachedTemplate:
 
     if not group:
       raise HTTPException(status_code=404, detail="Group not found")
@@ -14,14 +108,13 @@ def get_template(db: Session, group: str, connection_name: str, state: str) -> T
     if not connection_name:
       raise HTTPException(status_code=404, detail="Connect name not found")
 
-    key  = f"{group}-{connection_name}-{state}"
+    key  = template_title(group, connection_name, state)
 
     logging.info(f"Getting template for '{key}'")
 
-    template = db.query(Template).filter(Template.title == key).first()
+    template = get_template_by_title(db, key)
 
     if not template:
       raise HTTPException(status_code=404, detail=" No Template found")
 
     return template
-
@@ -7,12 +7,14 @@ from sqlalchemy.orm import Session
 from dateutil.relativedelta import relativedelta
 import pytz
 from collections import defaultdict
+from functools import partial
 
 from app.models import Client, BillingStatus
 from app.utils.mikrotik_config import MikroTikClient
 from app.websocket_manager import manager
 from app.utils.messengerV2 import send_message
 from app.utils.messages import get_messages, safe_format
+from app.services import clients_cache
 
 logger = logging.getLogger("billing")
 
@@ -75,8 +77,10 @@ def enforce_billing_rules(
     db: Session,
     mode: str = "enforce",
     display_name: str = None,
+    commit: bool = True,
 ):
-  """Apply billing rules and mirror notices to ADMIN client automatically."""
+  """Apply billing rules and mirror notices to ADMIN client automatically.
+  Pass commit=False to leave the notice logs for the caller's transaction."""
   if days_overdue < 0:
     logger.info(
       f"💰 [{display_name or client.name}] Paid in advance — next billing on {last_billing_date}.")
@@ -132,7 +136,7 @@ def enforce_billing_rules(
         msg_text = safe_format(admin_msgs[notice_type], **kwargs)
 
         for admin in admins:
-          send_message(db, admin.messenger_id, f"📨 Mirrored {notice_type}" , msg_text)
+          send_message(db, admin.messenger_id, f"📨 Mirrored {notice_type}" , msg_text, commit=commit)
           logger.info(
             f"📨 Mirrored {notice_type} to {admin.connection_name} "
             f"(group={admin.group_name}) for [{client_identifier}]."
@@ -160,7 +164,7 @@ def enforce_billing_rules(
           amount=amount_value,
           payment_location=payment_location,
         )
-        send_message(db, client.messenger_id, f"DUE notice sent to {name_to_show}", message_text)
+        send_message(db, client.messenger_id, f"DUE notice sent to {name_to_show}", message_text, commit=commit)
         logger.info(f"📩 [{name_to_show}] DUE notice sent.")
 
         mirror_to_admin(
@@ -186,7 +190,7 @@ def enforce_billing_rules(
           client_display=name_to_show,
           payment_location=payment_location,
         )
-        send_message(db, client.messenger_id, "Throttle notice", throttle_msg)
+        send_message(db, client.messenger_id, "Throttle notice", throttle_msg, commit=commit)
         logger.info(f"📩 [{name_to_show}] Throttle notice sent.")
 
         mirror_to_admin(
@@ -213,7 +217,7 @@ def enforce_billing_rules(
           client_display=name_to_show,
           payment_location=payment_location,
         )
-        send_message(db, client.messenger_id, "Disconnection notice", disconnection_msg)
+        send_message(db, client.messenger_id, "Disconnection notice", disconnection_msg, commit=commit)
         logger.info(f"📩 [{name_to_show}] Disconnection notice sent.")
 
         mirror_to_admin(
@@ -238,23 +242,37 @@ def safe_broadcast(message: dict):
         loop = asyncio.get_running_loop()
         loop.create_task(manager.broadcast(message))
     except RuntimeError:
-        asyncio.run(manager.broadcast(message))
+        # Worker/scheduler thread — hand off to the websocket loop
+        manager.safe_broadcast(message)
 
 
 # =====================================================
 # ✅ Main Billing Cycle (Group Aware)
 # =====================================================
 
-def check_billing(db: Session, mode: str = "enforce", group_name: str = None):
+def billing_scope():
+    """SQL filter for clients that take part in billing."""
+    return Client.connection_name.ilike(f"%{BILLING_FILTER}%")
+
+
+def check_billing(
+    db: Session,
+    mode: str = "enforce",
+    group_name: str = None,
+    routers: list[dict] | None = None,
+    clients: list[Client] | None = None,
+    commit: bool = True,
+):
     today = datetime.now(PH_TZ)
     today_date = today.date()
-    routers = load_all_mikrotiks()
-
-    query = db.query(Client).filter(Client.connection_name.ilike(f"%{BILLING_FILTER}%"))
-    if group_name:
-        query = query.filter(Client.group_name == group_name)
+    if routers is None:
+        routers = load_all_mikrotiks()
 
-    clients = query.all()
+    if clients is None:
+        query = db.query(Client).filter(billing_scope())
+        if group_name:
+            query = query.filter(Client.group_name == group_name)
+        clients = query.all()
     total = cnt_due = cnt_limited = cnt_cutoff = cnt_skipped = 0
 
     grouped_by_conn = defaultdict(list)
@@ -265,7 +283,6 @@ def check_billing(db: Session, mode: str = "enforce", group_name: str = None):
     logger.info(f"🔔 Starting billing run (mode={mode}) for group='{group_name}' — {len(clients)} clients.")
 
     for client in clients:
-        db.refresh(client)
         total += 1
 
         if not client.billing_date or not client.connection_name:
@@ -296,7 +313,10 @@ def check_billing(db: Session, mode: str = "enforce", group_name: str = None):
             cnt_cutoff += 1
 
         old_status = client.status
-        enforce_billing_rules(client, mikrotik, days_overdue, last_billing_date, db, mode, display_name=display_name)
+        enforce_billing_rules(
+            client, mikrotik, days_overdue, last_billing_date, db, mode,
+            display_name=display_name, commit=commit,
+        )
 
         if mode == "enforce" and client.status != old_status:
             logger.info(
@@ -310,7 +330,13 @@ def check_billing(db: Session, mode: str = "enforce", group_name: str = None):
                 "local_time": today.strftime("%Y-%m-%d %H:%M:%S %Z"),
             })
 
-    db.commit()
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    if mode == "enforce":
+        # sync/notification runs never change client rows
+        clients_cache.bump_version()
     summary = {
         "group": group_name,
         "mode": mode,
@@ -337,7 +363,18 @@ def decrement_billing_cycle(client: Client):
     client.billing_date = (client.billing_date or datetime.now(PH_TZ).date()) - relativedelta(months=1)
 
 
-def apply_billing_to_client(db: Session, client: Client, mode: str = "enforce"):
+def billing_update_event(client: Client) -> dict:
+    return {
+        "event": "billing_update",
+        "client_id": client.id,
+        "status": client.status.value if hasattr(client.status, "value") else client.status,
+        "billing_date": client.billing_date.isoformat() if client.billing_date else None,
+        "local_time": datetime.now(PH_TZ).strftime("%Y-%m-%d %H:%M:%S %Z"),
+    }
+
+
+def apply_billing_to_client(db: Session, client: Client, mode: str = "enforce", commit: bool = True):
+    """commit=False leaves the commit (and any broadcast) to the caller."""
     today = datetime.now(PH_TZ).date()
     routers = load_all_mikrotiks()
     mikrotik = get_router_for_client(client, routers)
@@ -346,20 +383,24 @@ def apply_billing_to_client(db: Session, client: Client, mode: str = "enforce"):
 
     days_overdue = (today - get_last_billing_date(client)).days
     old_status = client.status
-    enforce_billing_rules(client, mikrotik, days_overdue, get_last_billing_date(client), db, mode)
+    enforce_billing_rules(client, mikrotik, days_overdue, get_last_billing_date(client), db, mode, commit=commit)
+
+    if not commit:
+        return
 
     if client.status != old_status:
-        safe_broadcast({
-            "event": "billing_update",
-            "client_id": client.id,
-            "status": client.status.value,
-            "billing_date": client.billing_date.isoformat() if client.billing_date else None,
-            "local_time": datetime.now(PH_TZ).strftime("%Y-%m-%d %H:%M:%S %Z"),
-        })
+        safe_broadcast(billing_update_event(client))
     db.commit()
+    clients_cache.bump_version()
 
 
-def handle_paid_client(db: Session, client: Client):
+def handle_paid_client(db: Session, client: Client, commit: bool = True):
+    """
+    Unblock, reset speed and advance the billing cycle of a paying client.
+    commit=False is for batch callers that have already written status=PAID
+    in bulk and commit once: no status write, commit or broadcast here, and
+    errors propagate so the caller can roll the whole batch back.
+    """
     try:
         routers = load_all_mikrotiks()
         mikrotik = get_router_for_client(client, routers)
@@ -371,39 +412,42 @@ def handle_paid_client(db: Session, client: Client):
           logger.info(
           f"✅ [{client.name}] unblocked and speed reset to Unlimited (PAID).")
 
-        client.status = BillingStatus.PAID
+        if commit:
+            client.status = BillingStatus.PAID
         client.speed_limit = "Unlimited"
 
         increment_billing_cycle(client)
-        apply_billing_to_client(db, client, "enforce")
-        db.refresh(client)
-
-        safe_broadcast({
-            "event": "billing_update",
-            "client_id": client.id,
-            "status": client.status.value if hasattr(client.status, "value") else client.status,
-            "billing_date": client.billing_date.isoformat() if client.billing_date else None,
-            "local_time": datetime.now(PH_TZ).strftime("%Y-%m-%d %H:%M:%S %Z"),
-        })
+        apply_billing_to_client(db, client, "enforce", commit=commit)
+        if commit:
+            db.refresh(client)
+            safe_broadcast(billing_update_event(client))
 
         logger.info(f"✅ [{client.name}] marked as PAID — next due {client.billing_date}.")
     except Exception as e:
+        if not commit:
+            raise
         db.rollback()
         logger.error(f"Failed to handle paid client {client.name}: {e}")
 
 
-def handle_unpaid_client(db: Session, client: Client, mode: str = "enforce"):
+def handle_unpaid_client(db: Session, client: Client, mode: str = "enforce", commit: bool = True):
+    """Reapply billing to an unpaid client; commit=False as for handle_paid_client."""
     try:
-        apply_billing_to_client(db, client, mode)
-        db.refresh(client)
-        safe_broadcast({
-            "event": "billing_update",
-            "client_id": client.id,
-            "status": client.status.value if hasattr(client.status, "value") else client.status,
-            "billing_date": client.billing_date.isoformat() if client.billing_date else None,
-            "local_time": datetime.now(PH_TZ).strftime("%Y-%m-%d %H:%M:%S %Z"),
-        })
+        apply_billing_to_client(db, client, mode, commit=commit)
+        if commit:
+            db.refresh(client)
+            safe_broadcast(billing_update_event(client))
         logger.info(f"⚠️ [{client.name}] marked as UNPAID and billing reapplied.")
     except Exception as e:
+        if not commit:
+            raise
         db.rollback()
         logger.error(f"Failed to handle unpaid client {client.name}: {e}")
+
+
+# =====================================================
+# ✅ Mode-specialized entry points (resolved once by callers)
+# =====================================================
+check_billing_sync = partial(check_billing, mode="sync")
+check_billing_enforce = partial(check_billing, mode="enforce")
+check_billing_notify = partial(check_billing, mode="notification")
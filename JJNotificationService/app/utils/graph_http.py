@@ -0,0 +1,16 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+# ============================================================
+# 🌐 Shared Graph API HTTP session
+# Keeps TCP/TLS connections to graph.facebook.com alive across calls
+# (sync, Messenger sends) instead of handshaking on every request.
+# ============================================================
+GRAPH_POOL_CONNECTIONS = 4
+GRAPH_POOL_MAXSIZE = 20
+
+graph_session = requests.Session()
+graph_session.mount(
+    "https://",
+    HTTPAdapter(pool_connections=GRAPH_POOL_CONNECTIONS, pool_maxsize=GRAPH_POOL_MAXSIZE),
+)
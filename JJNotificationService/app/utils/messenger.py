@@ -1,33 +1,35 @@
 import os
-import json
+import orjson
 import requests
 from dotenv import load_dotenv
 
+from app.services.settings_service import is_messenger_enabled
+from app.utils.graph_http import graph_session
+
 load_dotenv()
 
 PAGE_ACCESS_TOKEN = os.getenv("PAGE_ACCESS_TOKEN")
 
-# Path to the settings file
-SETTINGS_FILE = "app/config/settings.json"
 
-def is_messenger_enabled() -> bool:
-    """
-    Check dynamically if Messenger sending is enabled.
-    Falls back to .env if settings.json does not exist.
-    """
-    try:
-        with open(SETTINGS_FILE, "r") as f:
-            data = json.load(f)
-            return data.get("ENABLE_MESSENGER_SEND", True)
-    except FileNotFoundError:
-        # fallback to .env value for backward compatibility
-        return os.getenv("ENABLE_MESSENGER_SEND", "true").lower() == "true"
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _build_body(messenger_id: str, message_json: bytes) -> bytes:
+    """Splice the per-recipient id around an already-encoded message object."""
+    return b"".join((
+        b'{"recipient":{"id":', orjson.dumps(messenger_id),
+        b'},"message":', message_json,
+        b',"tag":"CONFIRMED_EVENT_UPDATE"}',
+    ))
 
 
-def send_message(messenger_id: str, message: str) -> dict:
+def send_message(messenger_id: str, message: str, message_json: bytes | None = None) -> dict:
     """
     Send a Messenger message if ENABLE_MESSENGER_SEND is true.
     Returns {"skipped": True} if sending is disabled.
+    Pass message_json (e.g. CachedTemplate.message_json) to reuse a pre-encoded
+    {"text": ...} object when fanning the same message out to many clients.
     """
     ENABLE_MESSENGER_SEND = is_messenger_enabled()
 
@@ -38,14 +40,12 @@ def send_message(messenger_id: str, message: str) -> dict:
         return {"error": "Missing PAGE_ACCESS_TOKEN"}
 
     url = f"https://graph.facebook.com/v19.0/me/messages?access_token={PAGE_ACCESS_TOKEN}"
-    payload = {
-        "recipient": {"id": messenger_id},
-        "message": {"text": message},
-        "tag": "CONFIRMED_EVENT_UPDATE"
-    }
+    if message_json is None:
+        message_json = orjson.dumps({"text": message})
+    body = _build_body(messenger_id, message_json)
 
     try:
-        response = requests.post(url, json=payload, timeout=10)
+        response = graph_session.post(url, data=body, headers=_JSON_HEADERS, timeout=10)
         return response.json()
     except requests.RequestException as e:
         return {"error": str(e)}
@@ -1,25 +1,38 @@
 import os
-import json
+import orjson
 import requests
 from dotenv import load_dotenv
 from datetime import datetime
+from urllib.parse import urlencode
 from sqlalchemy.orm import Session
 
 from app import models
+from app.services.settings_service import is_messenger_enabled
+from app.utils.graph_http import graph_session
 
 load_dotenv()
 
 PAGE_ACCESS_TOKEN = os.getenv("PAGE_ACCESS_TOKEN")
-SETTINGS_FILE = "app/config/settings.json"
 
+GRAPH_BATCH_MAX = 50  # Graph API limit per batch request
 
-def is_messenger_enabled() -> bool:
-    try:
-        with open(SETTINGS_FILE, "r") as f:
-            data = json.load(f)
-            return data.get("ENABLE_MESSENGER_SEND", True)
-    except FileNotFoundError:
-        return os.getenv("ENABLE_MESSENGER_SEND", "true").lower() == "true"
+
+def _log(
+    db: Session,
+    title: str,
+    message: str,
+    status: str,
+    sent_at: datetime | None,
+    commit: bool,
+):
+    db.add(models.MessageLog(
+        title=title,
+        message=message,
+        status=status,
+        sent_at=sent_at,
+    ))
+    if commit:
+        db.commit()
 
 
 def send_message(
@@ -27,23 +40,18 @@ def send_message(
     messenger_id: str,
     title: str,
     message: str,
+    commit: bool = True,
 ) -> dict:
     """
     Sends a Messenger message and logs the attempt.
+    Pass commit=False when sending in a loop and commit the logs once afterwards.
     """
 
     ENABLE_MESSENGER_SEND = is_messenger_enabled()
 
     # 🚫 Sending disabled (still log)
     if not ENABLE_MESSENGER_SEND:
-        log = models.MessageLog(
-            title=title,
-            message=message,
-            status="skipped",
-            sent_at=None,
-        )
-        db.add(log)
-        db.commit()
+        _log(db, title, message, "skipped", None, commit)
 
         return {
             "skipped": True,
@@ -51,14 +59,7 @@ def send_message(
         }
 
     if not PAGE_ACCESS_TOKEN:
-        log = models.MessageLog(
-            title=title,
-            message=message,
-            status="failed",
-            sent_at=None,
-        )
-        db.add(log)
-        db.commit()
+        _log(db, title, message, "failed", None, commit)
 
         return {"error": "Missing PAGE_ACCESS_TOKEN"}
 
@@ -70,31 +71,104 @@ def send_message(
     }
 
     try:
-        response = requests.post(url, json=payload, timeout=10)
+        response = graph_session.post(url, json=payload, timeout=10)
         data = response.json()
 
         is_sent = bool(data.get("message_id"))
 
-        log = models.MessageLog(
-            title=title,
-            message=message,
-            status="sent" if is_sent else "failed",
-            sent_at=datetime.utcnow() if is_sent else None,
+        _log(
+            db,
+            title,
+            message,
+            "sent" if is_sent else "failed",
+            datetime.utcnow() if is_sent else None,
+            commit,
         )
 
-        db.add(log)
-        db.commit()
-
         return data
 
     except requests.RequestException as e:
-        log = models.MessageLog(
-            title=title,
-            message=message,
-            status="failed",
-            sent_at=None,
-        )
-        db.add(log)
-        db.commit()
+        _log(db, title, message, "failed", None, commit)
 
         return {"error": str(e)}
+
+
+def _batch_entry(messenger_id: str, message: str) -> dict:
+    return {
+        "method": "POST",
+        "relative_url": "v19.0/me/messages",
+        "body": urlencode({
+            "recipient": orjson.dumps({"id": messenger_id}).decode(),
+            "message": orjson.dumps({"text": message}).decode(),
+            "tag": "CONFIRMED_EVENT_UPDATE",
+        }),
+    }
+
+
+def send_message_batch(
+    db: Session,
+    items: list[tuple[str, str, str]],
+) -> list[dict]:
+    """
+    Sends several (messenger_id, title, message) items through one Graph
+    batch request per GRAPH_BATCH_MAX and logs each attempt.
+    Returns one result dict per item, in order; the logs are committed once.
+    """
+    if not items:
+        return []
+
+    if not is_messenger_enabled():
+        for messenger_id, title, message in items:
+            _log(db, title, message, "skipped", None, False)
+        db.commit()
+        return [{"skipped": True, "messenger_id": mid} for mid, _, _ in items]
+
+    if not PAGE_ACCESS_TOKEN:
+        for _, title, message in items:
+            _log(db, title, message, "failed", None, False)
+        db.commit()
+        return [{"error": "Missing PAGE_ACCESS_TOKEN"} for _ in items]
+
+    results: list[dict] = []
+    for start in range(0, len(items), GRAPH_BATCH_MAX):
+        chunk = items[start:start + GRAPH_BATCH_MAX]
+        batch = [_batch_entry(mid, message) for mid, _, message in chunk]
+
+        try:
+            response = graph_session.post(
+                "https://graph.facebook.com/",
+                data={
+                    "access_token": PAGE_ACCESS_TOKEN,
+                    "batch": orjson.dumps(batch).decode(),
+                },
+                timeout=10,
+            )
+            replies = response.json()
+            if not isinstance(replies, list):
+                raise ValueError(replies)
+        except (requests.RequestException, ValueError) as e:
+            replies = [None] * len(chunk)
+            error = {"error": str(e)}
+        else:
+            error = None
+
+        for (_, title, message), reply in zip(chunk, replies):
+            # Each reply is {"code": ..., "body": "<json>"} (or null if Graph gave up on it)
+            try:
+                data = orjson.loads(reply["body"]) if reply else error or {"error": "No response"}
+            except (KeyError, TypeError, orjson.JSONDecodeError):
+                data = {"error": "Malformed batch reply"}
+
+            is_sent = bool(data.get("message_id"))
+            _log(
+                db,
+                title,
+                message,
+                "sent" if is_sent else "failed",
+                datetime.utcnow() if is_sent else None,
+                False,
+            )
+            results.append(data)
+
+    db.commit()
+    return results
@@ -3,8 +3,12 @@ import asyncio
 import logging
 from collections import deque
 
+import orjson
+
 logger = logging.getLogger("websocket_manager")
 
+BROADCAST_QUEUE_MAX = 1000  # background broadcasts buffered for the drain task
+
 
 class ConnectionManager:
     def __init__(self):
@@ -13,38 +17,41 @@ class ConnectionManager:
         self._loop = None
         self._pending_messages = deque(maxlen=100)  # buffer until loop ready
         self._warned_no_loop = False  # avoid log spam
-        self._flush_tasks = []  # prevent premature GC of flush tasks
+        self._queue: asyncio.Queue | None = None  # background broadcasts, drained in order
+        self._drain_task = None
 
     async def connect(self, websocket: WebSocket):
         # store main loop when first websocket connects
         if not self._loop:
+            self._queue = asyncio.Queue(maxsize=BROADCAST_QUEUE_MAX)
+            self._drain_task = asyncio.create_task(self._drain())
             self._loop = asyncio.get_running_loop()
             # flush any pending messages queued before loop ready
             if self._pending_messages:
                 logger.info(f"🌀 Flushing {len(self._pending_messages)} queued broadcasts...")
-                tasks = []
                 while self._pending_messages:
-                    msg = self._pending_messages.popleft()
-                    task = asyncio.create_task(self.broadcast(msg))
-                    tasks.append(task)
-                # store tasks to prevent GC until complete
-                self._flush_tasks.extend(tasks)
-                # optional cleanup once all flush tasks finish
-                asyncio.create_task(self._cleanup_tasks(tasks))
+                    self._enqueue(self._pending_messages.popleft())
 
         await websocket.accept()
         async with self.lock:
             self.active_connections.append(websocket)
         logger.info(f"✅ WebSocket connected: {id(websocket)} | Total: {len(self.active_connections)}")
 
-    async def _cleanup_tasks(self, tasks):
-        """Remove completed flush tasks after they're done to avoid memory growth."""
-        try:
-            await asyncio.gather(*tasks)
-        finally:
-            for t in tasks:
-                if t in self._flush_tasks:
-                    self._flush_tasks.remove(t)
+    def _enqueue(self, message: dict):
+        """Runs on the loop thread; drops the oldest message if the consumer falls behind."""
+        if self._queue.full():
+            self._queue.get_nowait()
+            logger.warning("⚠️ Broadcast queue full — dropped oldest message.")
+        self._queue.put_nowait(message)
+
+    async def _drain(self):
+        """Single consumer: background broadcasts go out one at a time, in order."""
+        while True:
+            message = await self._queue.get()
+            try:
+                await self.broadcast(message)
+            except Exception as e:
+                logger.error(f"❌ Broadcast drain failed: {e}")
 
     async def disconnect(self, websocket: WebSocket):
         async with self.lock:
@@ -52,23 +59,36 @@ class ConnectionManager:
                 self.active_connections.remove(websocket)
         logger.info(f"❌ WebSocket disconnected: {id(websocket)} | Total: {len(self.active_connections)}")
 
+    async def _send(self, connection: WebSocket, payload: str) -> bool:
+        """Send a pre-encoded payload; return False if the socket should be dropped."""
+        try:
+            if connection.application_state.name != "CONNECTED":
+                return False
+            await connection.send_text(payload)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to send to {id(connection)}: {e}")
+            return False
+
     async def broadcast(self, message: dict):
         """Send message to all connected clients safely (async context)."""
         async with self.lock:
-            if not self.active_connections:
-                return
-
-            to_remove = []
-            for connection in self.active_connections:
-                try:
-                    if connection.application_state.name == "CONNECTED":
-                        await connection.send_json(message)
-                    else:
-                        to_remove.append(connection)
-                except Exception as e:
-                    logger.warning(f"⚠️ Failed to send to {id(connection)}: {e}")
-                    to_remove.append(connection)
+            connections = list(self.active_connections)
+        if not connections:
+            return
+
+        # ✅ Encode once, then fan out concurrently (compact UTF-8 JSON, like send_json)
+        payload = orjson.dumps(message).decode()
+        results = await asyncio.gather(
+            *(self._send(conn, payload) for conn in connections),
+            return_exceptions=True,
+        )
 
+        to_remove = [conn for conn, ok in zip(connections, results) if ok is not True]
+        if not to_remove:
+            return
+
+        async with self.lock:
             for conn in to_remove:
                 if conn in self.active_connections:
                     self.active_connections.remove(conn)
@@ -89,7 +109,8 @@ class ConnectionManager:
             return
 
         try:
-            asyncio.run_coroutine_threadsafe(self.broadcast(message), self._loop)
+            # Hand off only — the DB/poll thread never waits on socket I/O
+            self._loop.call_soon_threadsafe(self._enqueue, message)
         except Exception as e:
             logger.error(f"❌ safe_broadcast failed: {e}")
 
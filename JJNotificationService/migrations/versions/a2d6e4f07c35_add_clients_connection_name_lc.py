@@ -0,0 +1,27 @@
+"""Add clients connection_name_lc
+
+Revision ID: a2d6e4f07c35
+Revises: f1c3d8a92b64
+Create Date: 2026-10-16 14:51:33.608142
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2d6e4f07c35'
+down_revision: Union[str, Sequence[str], None] = 'f1c3d8a92b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.add_column("clients", sa.Column("connection_name_lc", sa.String(), nullable=True))
+    op.execute("UPDATE clients SET connection_name_lc = LOWER(connection_name)")
+
+
+def downgrade():
+    op.drop_column("clients", "connection_name_lc")
@@ -0,0 +1,60 @@
+"""Add billing hot path indexes
+
+Revision ID: b3e1c5a7d920
+Revises: f7d03f49da99
+Create Date: 2026-10-16 09:12:41.305118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e1c5a7d920'
+down_revision: Union[str, Sequence[str], None] = 'f7d03f49da99'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_clients_status_billing_date",
+        "clients",
+        ["status", "billing_date"],
+    )
+
+    op.create_index(
+        "ix_clients_group_name",
+        "clients",
+        ["group_name"],
+    )
+
+    # Only overdue candidates — PAID rows never need a billing_date range scan
+    op.create_index(
+        "ix_clients_unpaid_billing_date",
+        "clients",
+        ["billing_date"],
+        postgresql_where=sa.text("status <> 'PAID'"),
+    )
+
+    op.create_index(
+        "ix_message_logs_status_sent_at",
+        "message_logs",
+        ["status", "sent_at"],
+    )
+
+    op.create_index(
+        "ix_message_logs_sent_at",
+        "message_logs",
+        ["sent_at"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_message_logs_sent_at", table_name="message_logs")
+    op.drop_index("ix_message_logs_status_sent_at", table_name="message_logs")
+    op.drop_index("ix_clients_unpaid_billing_date", table_name="clients")
+    op.drop_index("ix_clients_group_name", table_name="clients")
+    op.drop_index("ix_clients_status_billing_date", table_name="clients")
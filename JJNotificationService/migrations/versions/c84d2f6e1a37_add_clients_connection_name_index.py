@@ -0,0 +1,30 @@
+"""Add clients connection_name index
+
+Revision ID: c84d2f6e1a37
+Revises: b3e1c5a7d920
+Create Date: 2026-10-16 11:04:27.918362
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c84d2f6e1a37'
+down_revision: Union[str, Sequence[str], None] = 'b3e1c5a7d920'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_clients_connection_name",
+        "clients",
+        ["connection_name"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_clients_connection_name", table_name="clients")
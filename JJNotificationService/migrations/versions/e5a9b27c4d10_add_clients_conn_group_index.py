@@ -0,0 +1,37 @@
+"""Add clients (connection_name, group_name) index
+
+Revision ID: e5a9b27c4d10
+Revises: c84d2f6e1a37
+Create Date: 2026-10-16 13:42:08.511204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a9b27c4d10'
+down_revision: Union[str, Sequence[str], None] = 'c84d2f6e1a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Composite index also serves connection_name-only lookups (leading column)
+    op.create_index(
+        "ix_clients_conn_group",
+        "clients",
+        ["connection_name", "group_name"],
+    )
+    op.drop_index("ix_clients_connection_name", table_name="clients")
+
+
+def downgrade():
+    op.create_index(
+        "ix_clients_connection_name",
+        "clients",
+        ["connection_name"],
+    )
+    op.drop_index("ix_clients_conn_group", table_name="clients")
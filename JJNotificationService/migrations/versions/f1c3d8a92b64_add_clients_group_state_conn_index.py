@@ -0,0 +1,37 @@
+"""Add clients (group_name, state, connection_name) index
+
+Revision ID: f1c3d8a92b64
+Revises: e5a9b27c4d10
+Create Date: 2026-10-16 14:18:51.204377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c3d8a92b64'
+down_revision: Union[str, Sequence[str], None] = 'e5a9b27c4d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Leading group_name column also covers the old single-column index
+    op.create_index(
+        "ix_clients_group_state_conn",
+        "clients",
+        ["group_name", "state", "connection_name"],
+    )
+    op.drop_index("ix_clients_group_name", table_name="clients")
+
+
+def downgrade():
+    op.create_index(
+        "ix_clients_group_name",
+        "clients",
+        ["group_name"],
+    )
+    op.drop_index("ix_clients_group_state_conn", table_name="clients")